@@ -0,0 +1 @@
+""" Benchmarks for the quips views, run with `python -m bench.run` """
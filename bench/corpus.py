@@ -0,0 +1,77 @@
+import random
+import time
+
+from smash import counters, db, dedup, importer, search
+from smash.models_sqlalchemy import TIME_FORMAT
+
+SYLLABLES = ['ka', 'lo', 'mi', 'ne', 'ru', 'sa', 'ti', 'vo', 'zu', 'ba',
+             'de', 'fi', 'go', 'ha', 'je', 'ku', 'ly', 'mo', 'pa', 'qi']
+NICKS = 24
+# Quotes are spread over the YEARS before this date (2021-01-01 UTC)
+END = 1609459200
+YEARS = 5
+# One quote in PENDING_EVERY waits in the moderation queue
+PENDING_EVERY = 50
+
+
+def vocabulary(rng, size):
+    words = set()
+    while len(words) < size:
+        words.add(''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(1, 4))))
+    return sorted(words)
+
+
+def records(quotes, seed=0, tags=None):
+    """ Yields `quotes` synthetic quotes in /export format.
+
+    The same seed always gives the same corpus. Words and tags follow a
+    long-tailed distribution like real ones do, and ratings come from a
+    random number of mostly positive votes.
+    """
+    rng = random.Random(seed)
+    words = vocabulary(rng, 2000)
+    word_weights = [1.0 / rank for rank in range(1, len(words) + 1)]
+    nicks = ['<{}>'.format(word) for word in rng.sample(words, NICKS)]
+    tag_names = vocabulary(rng, tags or max(20, quotes // 50))
+    tag_weights = [1.0 / rank for rank in range(1, len(tag_names) + 1)]
+    start = END - YEARS * 365 * 86400
+
+    for _ in range(quotes):
+        lines = [
+            '{} {}'.format(rng.choice(nicks),
+                           ' '.join(rng.choices(words, word_weights, k=rng.randint(3, 15))))
+            for _ in range(rng.randint(1, 4))
+        ]
+        votes = int(rng.expovariate(0.1))
+        up = sum(rng.random() < 0.7 for _ in range(votes))
+        yield {
+            'content': '\n'.join(lines),
+            'rating': up - (votes - up),
+            'time': time.strftime(TIME_FORMAT, time.localtime(rng.randint(start, END))),
+            'authorIP': '10.0.{}.{}'.format(rng.randint(0, 255), rng.randint(1, 254)),
+            'tags': rng.choices(tag_names, tag_weights, k=rng.randint(0, 3)),
+        }
+
+
+def generate(quotes, seed=0, tags=None, batch_size=importer.BATCH):
+    """ Fills the (empty) app database with a synthetic corpus """
+    items = records(quotes, seed, tags)
+    connection = db.engine.raw_connection()
+    try:
+        tag_ids = {}
+        while True:
+            batch = [item for _, item in zip(range(batch_size), items)]
+            if not batch:
+                break
+            importer.write_batch(connection, tag_ids, batch)
+        dedup.index_missing(connection)
+    finally:
+        connection.close()
+
+    db.session.execute(
+        "UPDATE quotes SET approved = 0 WHERE id % :every = 0",
+        {'every': PENDING_EVERY}
+    )
+    counters.rebuild()
+    search.rebuild()
+    db.session.commit()
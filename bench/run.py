@@ -0,0 +1,306 @@
+""" Times every view against a synthetic corpus and checks it against the
+budgets in bench/budgets.json:
+
+    python -m bench.run
+    python -m bench.run --quotes 100000 --requests 20
+
+Exits with status 1 when a route is over budget.
+"""
+import argparse
+import gc
+import json
+import logging
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+BUDGETS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'budgets.json')
+# Room left above a measured run by --write-budgets; timings vary between
+# machines far more than statement counts or allocations do
+HEADROOM = {'p95_ms': 3.0, 'statements': 1.0, 'peak_kb': 1.5}
+
+
+class Route(object):
+    """ One request to time. `url` and `data` may be functions of the
+    iteration number, so writes don't hit the same row every time.
+    """
+
+    def __init__(self, name, url, method='GET', data=None, body=None,
+                 moderator=False):
+        self.name = name
+        self.url = url
+        self.method = method
+        self.data = data
+        self.body = body
+        self.moderator = moderator
+
+
+    def request(self, client, i):
+        url = self.url(i) if callable(self.url) else self.url
+        kwargs = {}
+        if self.data is not None:
+            kwargs['data'] = self.data(i) if callable(self.data) else self.data
+        if self.body is not None:
+            kwargs['data'] = json.dumps(self.body(i))
+        response = client.open(url, method=self.method, **kwargs)
+        # Streamed responses only do their work while being read
+        response.get_data()
+        response.close()
+        return response
+
+
+def routes(corpus):
+    """ A request for every view in smash.views """
+    from smash import pagination
+
+    approved = corpus['approved']
+    pending = corpus['pending']
+    ids = corpus['ids']
+    deep = max(1, approved // pagination.PER_PAGE // 2)
+    tag = corpus['tag']
+    word = corpus['word']
+    year, month = corpus['month']
+
+    return [
+        Route('index', '/'),
+        Route('login', '/login'),
+        Route('latest', '/latest'),
+        Route('latest_deep', '/latest/{}'.format(deep)),
+        Route('top', '/top'),
+        Route('top_deep', '/top/{}'.format(deep)),
+        Route('hot', '/hot'),
+        Route('hot_deep', '/hot/{}'.format(deep)),
+        Route('browse', '/browse'),
+        Route('browse_deep', '/browse/{}'.format(deep)),
+        Route('archive_index', '/archive'),
+        Route('archive_month', '/archive/{}/{}'.format(year, month)),
+        Route('random', '/random?seed=1'),
+        Route('random_deep', '/random/{}?seed=1'.format(deep)),
+        Route('quote', lambda i: '/quip/{}'.format(ids[i % len(ids)])),
+        Route('tag', '/tag/{}'.format(tag)),
+        Route('tag_deep', '/tag/{}/{}'.format(tag, max(1, corpus['tagged'] // pagination.PER_PAGE // 2))),
+        Route('tags', '/tags'),
+        Route('tags_popular', '/tags?sort=popular'),
+        Route('tags_suggest', '/tags/suggest?q={}'.format(tag[:2])),
+        Route('search', '/search/{}'.format(word)),
+        Route('search_page2', '/search/{}/2'.format(word)),
+        Route('add_form', '/add'),
+        Route('add', '/add', 'POST',
+              data=lambda i: {'submit': 'Submit', 'newquote': 'bench quote {}'.format(i),
+                              'tags': '{},bench'.format(tag)}),
+        Route('slack', '/slack', 'POST', data=lambda i: {'text': 'slack quote {}'.format(i)}),
+        Route('upvote', '/upvote', 'POST', body=lambda i: {'postid': ids[i % len(ids)]}),
+        Route('downvote', '/downvote', 'POST', body=lambda i: {'postid': ids[i % len(ids)]}),
+        Route('export', '/export'),
+        Route('export_ndjson', '/export?format=ndjson'),
+        Route('queue', '/queue', moderator=True),
+        Route('queue_deep', '/queue/{}'.format(max(1, pending // 50 // 2)), moderator=True),
+        Route('moderate', '/moderate', 'POST', moderator=True,
+              data=lambda i: {'quoteid': corpus['queue'][i % len(corpus['queue'])],
+                              'submit': 'Approve'}),
+    ]
+
+
+def percentile(samples, pct):
+    if len(samples) == 1:
+        return samples[0]
+    return statistics.quantiles(samples, n=100, method='inclusive')[pct - 1]
+
+
+def measure(route, clients, requests, cached):
+    """ Latencies (ms) and the most statements any one request sent """
+    from smash import cache
+    from smash.querycount import count_queries
+
+    client = clients[route.moderator]
+    latencies = []
+    statements = 0
+    for i in range(requests + 1):
+        if not cached:
+            cache.pages.clear()
+        with count_queries() as sent:
+            started = time.perf_counter()
+            response = route.request(client, i)
+            elapsed = time.perf_counter() - started
+        if response.status_code >= 400:
+            raise RuntimeError("{} returned {}".format(route.name, response.status_code))
+        # The first request warms up connections and templates
+        if i:
+            latencies.append(elapsed * 1000)
+            statements = max(statements, len(sent))
+    return latencies, statements
+
+
+def peak_memory(route, clients, cached):
+    """ Most memory (KB) allocated at once while serving the route """
+    from smash import cache
+
+    if not cached:
+        cache.pages.clear()
+    # Start every route from the same point in the collector's schedule, or
+    # whether a collection lands mid-request depends on the routes before it
+    gc.collect()
+    tracemalloc.reset_peak()
+    baseline = tracemalloc.get_traced_memory()[0]
+    route.request(clients[route.moderator], 0)
+    return (tracemalloc.get_traced_memory()[1] - baseline) / 1024
+
+
+def sample():
+    """ Values for the routes to ask for, read back from the corpus """
+    from smash import counters, db
+    from smash.models_sqlalchemy import Quote, Tag, tags_to_quotes
+
+    approved = [id for id, in db.session.query(Quote.id).filter_by(approved=True).
+                                             order_by(Quote.id).limit(1000)]
+    queue = [id for id, in db.session.query(Quote.id).filter_by(approved=False)]
+    tag, tagged = db.session.query(Tag.name, db.func.count()).\
+                             join(tags_to_quotes).\
+                             group_by(Tag.id).order_by(db.func.count().desc()).first()
+    created = db.session.query(db.func.max(Quote.created)).scalar()
+    month = time.localtime(created)
+    word = Quote.query.get(approved[0]).content.split()[1]
+
+    return {
+        'approved': counters.get(counters.APPROVED),
+        'pending': counters.get(counters.PENDING),
+        'ids': approved,
+        'queue': queue,
+        'tag': tag,
+        'tagged': tagged,
+        'word': word,
+        'month': (month.tm_year, month.tm_mon),
+    }
+
+
+def over_budget(results, budgets):
+    problems = []
+    for name, result in results.items():
+        budget = budgets.get(name)
+        if budget is None:
+            problems.append("{}: no budget".format(name))
+            continue
+        for key in ('p95_ms', 'statements', 'peak_kb'):
+            if key in budget and result[key] > budget[key]:
+                problems.append("{}: {} {:.1f} over budget {}".format(
+                    name, key, result[key], budget[key]))
+    return problems
+
+
+def write_budgets(results, quotes):
+    budgets = {
+        name: {key: int(-(-result[key] * factor // 1)) for key, factor in HEADROOM.items()}
+        for name, result in results.items()
+    }
+    with open(BUDGETS, 'w') as f:
+        json.dump({'quotes': quotes, 'routes': budgets}, f, indent=4, sort_keys=True)
+        f.write('\n')
+
+
+def main(argv=None):
+    with open(BUDGETS) as f:
+        budgets = json.load(f)
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--quotes', type=int, default=budgets['quotes'],
+                        help="corpus size (default: the one the budgets are for)")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--requests', type=int, default=30,
+                        help="timed requests per route")
+    parser.add_argument('--only', action='append',
+                        help="only run this route (can be repeated)")
+    parser.add_argument('--cached', action='store_true',
+                        help="let anonymous pages come from the page cache")
+    parser.add_argument('--write-budgets', action='store_true',
+                        help="replace the budgets with this run's numbers plus headroom")
+    parser.add_argument('--keep', action='store_true',
+                        help="keep the corpus database and print where it is")
+    args = parser.parse_args(argv)
+
+    # smash reads config.json from the working directory on import
+    workdir = tempfile.mkdtemp(prefix='quips-bench-')
+    with open(os.path.join(workdir, 'config.json'), 'w') as f:
+        json.dump({
+            'APPNAME': 'Quips bench',
+            'APPBRAND': 'Quips bench',
+            'MOTD': 'Benchmark',
+            'SECRETKEY': 'bench',
+            'ADMINSECRET': 'bench',
+            'DATABASE_URL': 'sqlite:///' + os.path.join(workdir, 'bench.db'),
+            'RATELIMIT_STORAGE_URL': 'memory://',
+            'VOTE_BUFFER_MS': 0,
+            # No background rescoring thread: its statements would land in
+            # whichever request happens to be running
+            'HOT_INTERVAL': 0,
+        }, f)
+    os.chdir(workdir)
+
+    from smash import create_app, limiter
+    from smash.commands import setup_database
+    from bench import corpus
+
+    app = create_app()
+    logging.getLogger().setLevel(logging.WARNING)
+    limiter.enabled = False
+    app.extensions['xcaptcha'].is_enabled = False
+
+    with app.app_context():
+        setup_database()
+        started = time.perf_counter()
+        corpus.generate(args.quotes, args.seed)
+        print("corpus: {} quotes in {:.1f}s ({})".format(
+            args.quotes, time.perf_counter() - started, workdir))
+        values = sample()
+
+        anonymous = app.test_client()
+        moderator = app.test_client()
+        moderator.post('/login', data={'secret': 'bench'})
+        clients = {False: anonymous, True: moderator}
+
+        selected = [route for route in routes(values)
+                    if not args.only or route.name in args.only]
+        results = {}
+        print("{:<16} {:>9} {:>9} {:>9} {:>6} {:>9}".format(
+            'route', 'p50 ms', 'p95 ms', 'p99 ms', 'stmts', 'peak KB'))
+        for route in selected:
+            latencies, statements = measure(route, clients, args.requests, args.cached)
+            results[route.name] = {
+                'p50_ms': percentile(latencies, 50),
+                'p95_ms': percentile(latencies, 95),
+                'p99_ms': percentile(latencies, 99),
+                'statements': statements,
+            }
+
+        # Tracing allocations slows everything down, so memory gets its own pass
+        tracemalloc.start()
+        for route in selected:
+            results[route.name]['peak_kb'] = peak_memory(route, clients, args.cached)
+        tracemalloc.stop()
+
+        for route in selected:
+            result = results[route.name]
+            print("{:<16} {:>9.2f} {:>9.2f} {:>9.2f} {:>6} {:>9.0f}".format(
+                route.name, result['p50_ms'], result['p95_ms'], result['p99_ms'],
+                result['statements'], result['peak_kb']))
+
+    if not args.keep:
+        shutil.rmtree(workdir)
+
+    if args.write_budgets:
+        write_budgets(results, args.quotes)
+        return 0
+    if args.quotes != budgets['quotes']:
+        print("budgets are for {} quotes, not checking them".format(budgets['quotes']))
+        return 0
+    problems = over_budget(results, budgets['routes'])
+    for problem in problems:
+        print("OVER BUDGET " + problem)
+    return 1 if problems else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
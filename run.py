@@ -1,7 +1,15 @@
 import os
-from smash import app, conf
+from smash import conf, create_app
+from smash.commands import setup_database
+
+app = create_app()
 
 if __name__=='__main__':
+    # The development server is a single process, so it can set up the
+    # database itself; production deploys run `flask init-db` once instead
+    with app.app_context():
+        setup_database()
+
     if 'HEROKU' in conf.config and conf.config['HEROKU']==1:
         app.run(host= '0.0.0.0', port=os.environ['PORT'])
     else:
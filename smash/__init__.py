@@ -1,66 +1,90 @@
-import os
-from flask import Flask, g
+import time
+
+STARTED = time.perf_counter()
+
+import logging
+from flask import Flask
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
-from flask_sqlalchemy import SQLAlchemy
 from flask_xcaptcha import XCaptcha
-from . import config, log
+from jinja2 import FileSystemBytecodeCache
+from . import config, engine, log, ratelimit
 
+logger = logging.getLogger(__name__)
 
-log.configure_logging()
-app = Flask(__name__)
 conf = config.Config('config.json')
-app.config['XCAPTCHA_SITE_KEY'] = "YOUR_SITE_KEY"
-app.config['XCAPTCHA_SECRET_KEY'] = "YOUR_SECRET_KEY"
-app.config['XCAPTCHA_VERIFY_URL'] = "https://hcaptcha.com/siteverify"
-app.config['XCAPTCHA_API_URL'] = "https://hcaptcha.com/1/api.js"
-app.config['XCAPTCHA_DIV_CLASS'] = "h-captcha"
-
-xcaptcha = XCaptcha(app=app)
-
+db = engine.Database()
 limiter = Limiter(
-        app,
         key_func=get_remote_address,
         default_limits=["200000 per day", "60 per hour"]
 )
 
-# Load database URL for SQLAlchemy from environment
-#app.config['SQLALCHEMY_DATABASE_URI'] = os.environ['DATABASE_URL']
-app.config['SQLALCHEMY_DATABASE_URI'] = conf.config['DATABASE_URL']
 
-# This flag tells the program it's deployed on heroku
-if 'HEROKU' in os.environ:
-    conf.add(('HEROKU', 1))
+def create_app():
+    """ Builds the app.
+
+    Nothing here touches the database or writes config.json, so importing
+    and creating the app is cheap and safe under gunicorn --preload. The
+    schema is created and upgraded once with `flask init-db`.
+    """
+    timings = [('imports', time.perf_counter() - STARTED)]
+    mark = time.perf_counter()
 
-# Load app name from environment if it's not in the config
-if ('APPNAME' in conf.config and
-    conf.config['APPNAME']=="" and
-    'APPNAME' in os.environ):
-    conf.add(('APPNAME', os.environ['APPNAME']))
+    def phase(name):
+        nonlocal mark
+        now = time.perf_counter()
+        timings.append((name, now - mark))
+        mark = now
 
-# Load app brand name from environment if it's not in the config
-if ('APPBRAND' in conf.config and
-    conf.config['APPBRAND']=="" and
-    'APPBRAND' in os.environ):
-    conf.add(('APPBRAND', os.environ['APPBRAND']))
+    log.configure_logging()
+    app = Flask(__name__)
 
-# Load admin key and secret key from environment
-if 'ADMINSECRET' in os.environ:
-    conf.add(('ADMINSECRET', os.environ['ADMINSECRET']))
+    # Set the secret key
+    if 'SECRETKEY' in conf.config:
+        app.secret_key = conf.config['SECRETKEY']
+    else:
+        exit("Secret key not set.")
 
-if 'SECRETKEY' in os.environ:
-    conf.add(('SECRETKEY', os.environ['SECRETKEY']))
+    app.config['XCAPTCHA_SITE_KEY'] = "YOUR_SITE_KEY"
+    app.config['XCAPTCHA_SECRET_KEY'] = "YOUR_SECRET_KEY"
+    app.config['XCAPTCHA_VERIFY_URL'] = "https://hcaptcha.com/siteverify"
+    app.config['XCAPTCHA_API_URL'] = "https://hcaptcha.com/1/api.js"
+    app.config['XCAPTCHA_DIV_CLASS'] = "h-captcha"
 
-# Set the secret key
-if 'SECRETKEY' in conf.config:
-    app.secret_key = conf.config['SECRETKEY']
-else:
-    exit("Secret key not set.")
+    app.config['SQLALCHEMY_DATABASE_URI'] = conf.config['DATABASE_URL']
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine.engine_options(conf.config)
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['SQLITE_READ_ONLY_ENGINE'] = conf.config.get('SQLITE_READ_ONLY_ENGINE', False)
+    # Limits are counted once per host rather than once per worker
+    app.config['RATELIMIT_STORAGE_URL'] = ratelimit.storage_url(
+        conf.config.get('RATELIMIT_STORAGE_URL', 'shm://'),
+        conf.config['DATABASE_URL']
+    )
+    phase('config')
 
-db = SQLAlchemy(app)
+    engine.install(conf.config)
+    db.init_app(app)
+    limiter.init_app(app)
+    app.extensions['xcaptcha'] = XCaptcha(app=app)
+    phase('extensions')
 
-from smash.models_sqlalchemy import *
+    from . import assets, commands, metrics, views
+    app.register_blueprint(views.bp)
+    commands.init_app(app)
+    metrics.init_app(app)
+    assets.init_app(app)
+    phase('views')
 
-db.create_all()
+    # Compiled templates are shared through the cache directory, so only the
+    # first worker after a deploy (or `flask compile-templates`) parses them
+    app.jinja_env.bytecode_cache = FileSystemBytecodeCache(
+        conf.config.get('JINJA_CACHE_DIR') or None
+    )
+    phase('templates')
 
-from . import views
+    app.startup_timings = timings
+    logger.info("App created in %.1fms (%s)",
+                sum(seconds for _, seconds in timings) * 1000,
+                ", ".join("{} {:.1f}ms".format(name, seconds * 1000)
+                          for name, seconds in timings))
+    return app
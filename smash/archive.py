@@ -0,0 +1,53 @@
+import datetime
+import time
+
+from sqlalchemy.sql.expression import func
+
+from smash import db
+from smash.models_sqlalchemy import Quote
+
+DATE_FORMAT = "%Y-%m-%d"
+
+
+def local_epoch(when):
+    return int(time.mktime(when.timetuple()))
+
+
+def month_range(year, month):
+    """ [start, end) unix times of a month in local time """
+    start = datetime.datetime(year, month, 1)
+    if month == 12:
+        end = datetime.datetime(year + 1, 1, 1)
+    else:
+        end = datetime.datetime(year, month + 1, 1)
+    return local_epoch(start), local_epoch(end)
+
+
+def date_range(since=None, until=None):
+    """ [start, end) unix times for optional YYYY-MM-DD bounds, both
+    inclusive. Raises ValueError for malformed dates.
+    """
+    start = end = None
+    if since:
+        start = local_epoch(datetime.datetime.strptime(since, DATE_FORMAT))
+    if until:
+        end = local_epoch(datetime.datetime.strptime(until, DATE_FORMAT) +
+                          datetime.timedelta(days=1))
+    return start, end
+
+
+def within(query, start, end):
+    if start is not None:
+        query = query.filter(Quote.created >= start)
+    if end is not None:
+        query = query.filter(Quote.created < end)
+    return query
+
+
+def months():
+    """ [(year, month, count)] of approved quotes, newest month first """
+    month = func.strftime('%Y-%m', Quote.created, 'unixepoch', 'localtime')
+    rows = db.session.query(month, func.count(Quote.id)).\
+                      filter(Quote.approved == True, Quote.created != None).\
+                      group_by(month).order_by(month.desc())
+    return [(int(key[:4]), int(key[5:]), count) for key, count in rows]
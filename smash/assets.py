@@ -0,0 +1,148 @@
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import posixpath
+import re
+
+from flask import abort, current_app, request, send_from_directory, url_for
+
+from smash import limiter
+
+# Sources and source maps aren't served to browsers
+SKIP = ('.less', '.scss', '.map')
+# Fonts like woff and images like png are compressed already
+COMPRESS = ('.css', '.js', '.svg', '.eot', '.ttf', '.otf', '.json', '.txt')
+CSS_URL = re.compile(r'''url\(\s*(['"]?)([^'")?#]+)([?#][^'")]*)?\1\s*\)''')
+MAX_AGE = 365 * 24 * 3600
+
+# The build this worker serves: {'files': {path: fingerprinted path}, 'gzip': set}
+manifest = {'files': {}, 'gzip': set()}
+served = set()
+
+
+def fingerprint(path, data):
+    """ css/custom.css -> css/custom.<hash of the contents>.css """
+    stem, ext = posixpath.splitext(path)
+    return '{}.{}{}'.format(stem, hashlib.sha1(data).hexdigest()[:10], ext)
+
+
+def rewrite_css(path, data, files):
+    """ Points the url()s of a stylesheet at the fingerprinted files """
+    directory = posixpath.dirname(path)
+
+    def replace(match):
+        quote, target, suffix = match.groups()
+        resolved = posixpath.normpath(posixpath.join(directory, target))
+        if resolved not in files:
+            return match.group(0)
+        relative = posixpath.relpath(files[resolved], directory)
+        return 'url({0}{1}{2}{0})'.format(quote, relative, suffix or '')
+
+    return CSS_URL.sub(replace, data.decode('utf-8')).encode('utf-8')
+
+
+def write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+def build(static_folder, out):
+    """ Copies every asset under static_folder to `out` with its content
+    hash in the name, next to a gzipped copy where that's smaller, and
+    writes out/manifest.json. Returns the manifest.
+
+    Stylesheets go last so the fonts and images they point at already
+    have their new names.
+    """
+    sources = []
+    for root, _, names in os.walk(static_folder):
+        for name in names:
+            if not name.endswith(SKIP):
+                full = os.path.join(root, name)
+                sources.append(os.path.relpath(full, static_folder).replace(os.sep, '/'))
+    sources.sort(key=lambda path: (path.endswith('.css'), path))
+
+    files = {}
+    compressed = []
+    for path in sources:
+        with open(os.path.join(static_folder, path), 'rb') as f:
+            data = f.read()
+        if path.endswith('.css'):
+            data = rewrite_css(path, data, files)
+
+        hashed = fingerprint(path, data)
+        files[path] = hashed
+        write(os.path.join(out, hashed), data)
+
+        if path.endswith(COMPRESS):
+            packed = gzip.compress(data, 9, mtime=0)
+            if len(packed) < len(data):
+                write(os.path.join(out, hashed + '.gz'), packed)
+                compressed.append(hashed)
+
+    built = {'files': files, 'gzip': sorted(compressed)}
+    # Replaced in one step, so running workers never read half a manifest
+    tmp = os.path.join(out, 'manifest.json.tmp')
+    with open(tmp, 'w') as f:
+        json.dump(built, f, indent=1, sort_keys=True)
+    os.replace(tmp, os.path.join(out, 'manifest.json'))
+    return built
+
+
+def load(out):
+    """ The manifest of the last build, or an empty one """
+    try:
+        with open(os.path.join(out, 'manifest.json')) as f:
+            built = json.load(f)
+    except FileNotFoundError:
+        return {'files': {}, 'gzip': set()}
+    built['gzip'] = set(built['gzip'])
+    return built
+
+
+def static_url(filename):
+    """ URL of a static file: the fingerprinted copy once `flask
+    build-assets` has run, the plain /static one otherwise.
+    """
+    hashed = manifest['files'].get(filename)
+    if hashed is None:
+        return url_for('static', filename=filename)
+    return url_for('assets', filename=hashed)
+
+
+@limiter.exempt
+def serve(filename):
+    """ Fingerprinted assets never change, so browsers may keep them for a year """
+    if filename not in served:
+        abort(404)
+
+    path = filename
+    gzipped = filename in manifest['gzip'] and 'gzip' in request.accept_encodings
+    if gzipped:
+        path += '.gz'
+    response = send_from_directory(
+        dist_folder(current_app),
+        path,
+        mimetype=mimetypes.guess_type(filename)[0] or 'application/octet-stream',
+        cache_timeout=MAX_AGE
+    )
+    if gzipped:
+        response.headers['Content-Encoding'] = 'gzip'
+    response.headers['Cache-Control'] = 'public, max-age={}, immutable'.format(MAX_AGE)
+    response.vary.add('Accept-Encoding')
+    return response
+
+
+def dist_folder(app):
+    return os.path.join(app.root_path, 'dist')
+
+
+def init_app(app):
+    manifest.update(load(dist_folder(app)))
+    served.clear()
+    served.update(manifest['files'].values())
+    app.add_url_rule('/assets/<path:filename>', 'assets', serve)
+    app.jinja_env.globals['static_url'] = static_url
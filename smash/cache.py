@@ -0,0 +1,99 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import Response, make_response, request, session
+
+from smash import counters
+
+MAX_PAGES = 512
+# Pages also show things that change without a write, like today's date
+MAX_AGE = 300
+
+
+class PageCache(object):
+    """ Rendered anonymous pages of one worker, newest generation only """
+
+    def __init__(self, size=MAX_PAGES):
+        self.size = size
+        self.pages = OrderedDict()
+        self.lock = threading.Lock()
+
+
+    def get(self, key, generation):
+        with self.lock:
+            page = self.pages.get(key)
+            if page is None:
+                return None
+            if page['generation'] != generation or page['expires'] < time.time():
+                del self.pages[key]
+                return None
+            self.pages.move_to_end(key)
+            return page
+
+
+    def put(self, key, page):
+        with self.lock:
+            self.pages[key] = page
+            self.pages.move_to_end(key)
+            while len(self.pages) > self.size:
+                self.pages.popitem(last=False)
+
+
+    def clear(self):
+        with self.lock:
+            self.pages.clear()
+
+
+pages = PageCache()
+
+
+def generation():
+    return counters.get(counters.GENERATION)
+
+
+def invalidate():
+    """ Bumps the write generation, dropping every cached page in every worker.
+
+    Call it inside the transaction that changes what anonymous visitors see.
+    """
+    counters.incr(counters.GENERATION)
+
+
+def cached(view):
+    """ Serves a view from the page cache to visitors that aren't logged in """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if session.get('authorized'):
+            return view(*args, **kwargs)
+
+        current = generation()
+        key = (request.endpoint, request.full_path)
+        page = pages.get(key, current)
+
+        if page is None:
+            response = make_response(view(*args, **kwargs))
+            if response.status_code != 200:
+                return response
+
+            body = response.get_data()
+            page = {
+                'generation': current,
+                'expires': time.time() + MAX_AGE,
+                'body': body,
+                'mimetype': response.mimetype,
+                'etag': hashlib.sha1(body).hexdigest(),
+            }
+            pages.put(key, page)
+
+        response = Response(page['body'], mimetype=page['mimetype'])
+        response.set_etag(page['etag'])
+        # Let browsers and proxies keep the page but revalidate every time
+        response.headers['Cache-Control'] = 'no-cache'
+        # Logged in moderators get a different page for the same URL
+        response.vary.add('Cookie')
+        return response.make_conditional(request)
+
+    return wrapper
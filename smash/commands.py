@@ -0,0 +1,113 @@
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+
+from smash import assets, counters, db, dedup, importer, migrations, ranking, search
+
+
+def setup_database():
+    """ Creates missing tables, runs pending migrations and builds the
+    counters. Safe to run on every deploy.
+    """
+    db.create_all()
+    old, new = migrations.upgrade()
+    counters.ensure()
+    return old, new
+
+
+@click.command('init-db')
+@with_appcontext
+def init_db():
+    """ Creates or upgrades the database. """
+    old, new = setup_database()
+    click.echo("Database ready (schema version {}).".format(new))
+
+
+@click.command('rebuild-search')
+@with_appcontext
+def rebuild_search():
+    """ Rebuilds the full-text search index from the approved quotes. """
+    search.rebuild()
+    db.session.commit()
+    click.echo("Search index rebuilt.")
+
+
+@click.command('rank-hot')
+@click.option('--all', 'everything', is_flag=True,
+              help="Rescore every quote, not only the ones voted on.")
+@with_appcontext
+def rank_hot(everything):
+    """ Recomputes the /hot scores of quotes voted on since the last run. """
+    if everything:
+        ranking.mark_all()
+        db.session.commit()
+    click.echo("Rescored {} quotes.".format(ranking.refresh()))
+
+
+@click.command('import-quotes')
+@click.argument('source', type=click.File('r', encoding='utf-8'))
+@click.option('--checkpoint', type=click.Path(),
+              help="File recording progress; rerunning resumes from it.")
+@click.option('--batch-size', default=importer.BATCH, show_default=True)
+@with_appcontext
+def import_quotes(source, checkpoint, batch_size):
+    """ Imports approved quotes from /export output (JSON or NDJSON). """
+    def progress(imported, elapsed):
+        click.echo("{} quotes, {:.0f}/s".format(imported, imported / max(elapsed, 1e-6)))
+
+    imported = importer.run(source, checkpoint, batch_size, progress)
+    click.echo("Imported {} quotes.".format(imported))
+
+
+@click.command('dedup-index')
+@with_appcontext
+def dedup_index():
+    """ Indexes the quotes missing from the duplicate index. """
+    connection = db.engine.raw_connection()
+    try:
+        indexed = dedup.index_missing(connection)
+    finally:
+        connection.close()
+    click.echo("Indexed {} quotes.".format(indexed))
+
+
+@click.command('migrate')
+@with_appcontext
+def migrate():
+    """ Upgrades the database schema and checks the hot query plans. """
+    old, new = setup_database()
+    if old == new:
+        click.echo("Schema is up to date (version {}).".format(new))
+    else:
+        click.echo("Schema upgraded from version {} to {}.".format(old, new))
+
+    for name, plan, ok in migrations.explain():
+        click.echo("{} {}".format("ok  " if ok else "SLOW", name))
+        for line in plan:
+            click.echo("       " + line)
+
+
+@click.command('compile-templates')
+@with_appcontext
+def compile_templates():
+    """ Fills the Jinja bytecode cache so workers skip template parsing. """
+    env = current_app.jinja_env
+    names = env.list_templates(extensions=['html'])
+    for name in names:
+        env.get_template(name)
+    click.echo("Compiled {} templates.".format(len(names)))
+
+
+@click.command('build-assets')
+@with_appcontext
+def build_assets():
+    """ Writes fingerprinted and gzipped copies of the static files. """
+    built = assets.build(current_app.static_folder, assets.dist_folder(current_app))
+    click.echo("Built {} assets ({} gzipped) in {}.".format(
+        len(built['files']), len(built['gzip']), assets.dist_folder(current_app)))
+
+
+def init_app(app):
+    for command in (init_db, rebuild_search, rank_hot, import_quotes, dedup_index,
+                    migrate, compile_templates, build_assets):
+        app.cli.add_command(command)
@@ -1,31 +1,40 @@
 import json
+import os
+from types import MappingProxyType
 
-class Config(object):
-    def __init__(self, filename):
-        self.filename = filename
-        self.config = json.loads(open(self.filename, 'r').read())
 
+class Config(object):
+    """ Read-only snapshot of the config file with the environment overrides
+    applied. Loading it never writes the file back, so any number of workers
+    can start at the same time.
+    """
 
-    def save(self):
-        with open(self.filename, 'w') as outf:
-            outf.write(
-                json.dumps(
-                    self.config,
-                    indent=4,
-                    sort_keys=True)
-            )
+    def __init__(self, filename, environ=os.environ):
+        self.filename = filename
+        with open(self.filename, 'r') as inf:
+            config = json.load(inf)
+        apply_environ(config, environ)
+        self.config = MappingProxyType(config)
 
 
-    def reload(self):
-        self.config = json.loads(open(self.filename, 'r').read())
+def apply_environ(config, environ):
+    # This flag tells the program it's deployed on heroku
+    if 'HEROKU' in environ:
+        config['HEROKU'] = 1
 
+    # Load app name from environment if it's not in the config
+    if (config.get('APPNAME') == "" and
+        'APPNAME' in environ):
+        config['APPNAME'] = environ['APPNAME']
 
-    def add(self, param):
-        self.config[param[0]] = param[1]
-        self.save()
+    # Load app brand name from environment if it's not in the config
+    if (config.get('APPBRAND') == "" and
+        'APPBRAND' in environ):
+        config['APPBRAND'] = environ['APPBRAND']
 
+    # Load admin key and secret key from environment
+    if 'ADMINSECRET' in environ:
+        config['ADMINSECRET'] = environ['ADMINSECRET']
 
-    def remove(self, paramname):
-        if self.config.get(paramname) is not None:
-            del self.config[paramname]
-        self.save()
+    if 'SECRETKEY' in environ:
+        config['SECRETKEY'] = environ['SECRETKEY']
@@ -0,0 +1,64 @@
+from sqlalchemy.sql.expression import func
+
+from smash import db
+from smash.models_sqlalchemy import Counter, Quote
+
+APPROVED = 'approved'
+PENDING = 'pending'
+GENERATION = 'generation'
+TAGS = 'tags'
+
+
+def get(name):
+    """ Reads a counter; counters that were never written are 0 """
+    return db.session.query(Counter.value).filter_by(name=name).scalar() or 0
+
+
+def incr(name, delta=1):
+    """ Adjusts a counter inside the current transaction """
+    counters = Counter.__table__
+    result = db.session.execute(
+        counters.update().
+                 where(counters.c.name == name).
+                 values(value=counters.c.value + delta)
+    )
+    if result.rowcount == 0:
+        db.session.execute(counters.insert().values(name=name, value=delta))
+
+
+def approve(ids):
+    """ Moves pending quotes over to the approved counters """
+    incr(PENDING, -len(ids))
+    incr(APPROVED, len(ids))
+
+
+def discard(approved, pending):
+    """ Takes quotes that are about to be deleted off the counters """
+    if pending:
+        incr(PENDING, -len(pending))
+    if approved:
+        incr(APPROVED, -len(approved))
+
+
+def rebuild():
+    """ Recomputes every counter from the quotes table """
+    # The generations only ever move forward, or workers could serve a
+    # page or tag cloud cached under a reused number
+    db.session.query(Counter).filter(Counter.name.notin_([GENERATION, TAGS])).\
+                              delete(synchronize_session=False)
+
+    totals = dict(db.session.query(Quote.approved, func.count(Quote.id)).
+                             group_by(Quote.approved).all())
+    rows = [
+        Counter(APPROVED, totals.get(True, 0)),
+        Counter(PENDING, totals.get(False, 0) + totals.get(None, 0)),
+    ]
+
+    db.session.add_all(rows)
+
+
+def ensure():
+    """ Builds the counters the first time the app runs against a database """
+    if db.session.query(Counter.name).filter_by(name=APPROVED).first() is None:
+        rebuild()
+        db.session.commit()
@@ -0,0 +1,250 @@
+import hashlib
+import re
+import struct
+import zlib
+
+from sqlalchemy import bindparam, text
+
+from smash import conf, db
+
+# MinHash values per quote, in BANDS bands of ROWS values. Two quotes
+# sharing a band become candidates; with 16 x 4 that happens to most
+# pairs above about 50% similar and to few below it.
+BINS = 64
+BANDS = 16
+ROWS = BINS // BANDS
+SHINGLE = 3
+SIGNATURE = struct.Struct('<{}I'.format(BINS))
+EMPTY = 0xffffffff
+# Estimated similarity above which a quote is reported as a duplicate
+THRESHOLD = conf.config.get('DEDUP_THRESHOLD', 0.6)
+# Refuse submissions whose text is already in the database
+REJECT_EXACT = conf.config.get('DEDUP_REJECT_EXACT', False)
+CANDIDATES = 20
+
+WORD = re.compile(r'\w+')
+
+
+def hash64(data):
+    return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), 'little')
+
+
+def exact_hash(content):
+    """ Hash of the text as it reads, ignoring only case and spacing """
+    return hash64(' '.join(content.lower().split()).encode('utf-8')) >> 1
+
+
+def tokens(content):
+    """ Lowercased words without the numbers, so the timestamps of a
+    reposted log don't make it look different
+    """
+    return [word for word in WORD.findall(content.lower()) if not word.isdigit()]
+
+
+class Sketch(object):
+    """ What the index keeps about a quote's text: a hash of the whole
+    text for exact repeats, and a MinHash signature of its word shingles
+    for near ones.
+
+    The signature uses one-permutation hashing: every shingle is hashed
+    once and only counts towards the bin its hash falls in, and empty bins
+    borrow from the next full one, so it costs one hash per shingle.
+    """
+
+    def __init__(self, content):
+        self.exact = exact_hash(content)
+        words = tokens(content)
+
+        if len(words) >= SHINGLE:
+            shingles = set(' '.join(words[i:i + SHINGLE])
+                           for i in range(len(words) - SHINGLE + 1))
+        else:
+            shingles = set([' '.join(words)])
+
+        signature = [EMPTY] * BINS
+        for shingle in shingles:
+            value = hash64(shingle.encode('utf-8'))
+            slot = value % BINS
+            value = (value >> 32) & EMPTY
+            if value < signature[slot]:
+                signature[slot] = value
+        self.signature = densify(signature)
+
+
+    @property
+    def buckets(self):
+        return buckets(self.signature)
+
+
+    def similarity(self, signature):
+        """ Estimated Jaccard similarity to another signature """
+        return sum(a == b for a, b in zip(self.signature, signature)) / float(BINS)
+
+
+def buckets(signature):
+    """ One LSH bucket per band, as 32-bit integers. A collision only
+    adds a candidate to check, so a checksum is hash enough.
+    """
+    packed = SIGNATURE.pack(*signature)
+    size = ROWS * 4
+    return [
+        zlib.crc32(packed[band * size:(band + 1) * size], band)
+        for band in range(BANDS)
+    ]
+
+
+def densify(signature):
+    """ Fills every empty bin from the next full one to its right,
+    wrapping around past the end
+    """
+    carry = next((value for value in signature if value != EMPTY), None)
+    if carry is None:
+        return signature
+    for i in range(BINS - 1, -1, -1):
+        if signature[i] == EMPTY:
+            signature[i] = carry
+        else:
+            carry = signature[i]
+    return signature
+
+
+class Match(object):
+    def __init__(self, quote_id, similarity, exact=False):
+        self.quote_id = quote_id
+        self.similarity = similarity
+        self.exact = exact
+
+
+def find(sketch):
+    """ The Match of the existing quote most like the sketch, or None.
+
+    Exact repeats and the quotes sharing the most bands with this one come
+    back from one statement of index seeks, so the cost doesn't grow with
+    the number of quotes.
+    """
+    found = db.session.execute(
+        text('SELECT quoteid, signature, exact = :exact FROM "dedupSignatures" '
+             'WHERE exact = :exact OR quoteid IN '
+             '(SELECT quoteid FROM "dedupBuckets" WHERE bucket IN :buckets '
+             'GROUP BY quoteid ORDER BY count(*) DESC LIMIT :limit)').
+            bindparams(bindparam('buckets', expanding=True)),
+        {'exact': sketch.exact, 'buckets': sketch.buckets, 'limit': CANDIDATES}
+    ).fetchall()
+    for id, _, exact in found:
+        if exact:
+            return Match(id, 1.0, exact=True)
+    if not found:
+        return None
+
+    best = max((sketch.similarity(SIGNATURE.unpack(signature)), id)
+               for id, signature, _ in found)
+    if best[0] < THRESHOLD:
+        return None
+    return Match(best[1], best[0])
+
+
+def rejected(match):
+    return REJECT_EXACT and match is not None and match.exact
+
+
+def rows(quote_id, sketch, match=None):
+    """ (signature row, bucket rows) to index a quote under """
+    signature = (quote_id, sketch.exact, SIGNATURE.pack(*sketch.signature),
+                 match and match.quote_id, match and match.similarity)
+    return signature, [(bucket, quote_id) for bucket in set(sketch.buckets)]
+
+
+def write(cursor, indexed):
+    """ Indexes [(quote id, sketch)] through a DB-API cursor, for bulk loads """
+    signatures = []
+    keys = []
+    for quote_id, sketch in indexed:
+        signature, quote_keys = rows(quote_id, sketch)
+        signatures.append(signature)
+        keys.extend(quote_keys)
+    cursor.executemany('INSERT OR REPLACE INTO "dedupSignatures" '
+                       '(quoteid, exact, signature, duplicate_of, similarity) '
+                       'VALUES (?, ?, ?, ?, ?)', signatures)
+    cursor.executemany('INSERT OR IGNORE INTO "dedupBuckets" (bucket, quoteid) '
+                       'VALUES (?, ?)', keys)
+
+
+def index_missing(connection, batch=1000):
+    """ Indexes the quotes that aren't in the index yet, such as the ones
+    a bulk import has just loaded, committing every `batch` quotes.
+    Returns how many were indexed.
+    """
+    cursor = connection.cursor()
+    indexed = 0
+    last = 0
+    while True:
+        cursor.execute('SELECT id, content FROM quotes q WHERE id > ? AND NOT EXISTS '
+                       '(SELECT 1 FROM "dedupSignatures" s WHERE s.quoteid = q.id) '
+                       'ORDER BY id LIMIT ?', (last, batch))
+        rows = cursor.fetchall()
+        if not rows:
+            return indexed
+        write(cursor, [(id, Sketch(content)) for id, content in rows])
+        connection.commit()
+        indexed += len(rows)
+        last = rows[-1][0]
+
+
+def add(quote_id, sketch, match=None):
+    """ Indexes a new quote inside the current transaction, remembering
+    the duplicate find() reported for it
+    """
+    signature, keys = rows(quote_id, sketch, match)
+    db.session.execute(
+        text('INSERT OR REPLACE INTO "dedupSignatures" '
+             '(quoteid, exact, signature, duplicate_of, similarity) '
+             'VALUES (:quoteid, :exact, :signature, :duplicate_of, :similarity)'),
+        dict(zip(('quoteid', 'exact', 'signature', 'duplicate_of', 'similarity'), signature))
+    )
+    db.session.execute(
+        text('INSERT OR IGNORE INTO "dedupBuckets" (bucket, quoteid) VALUES (:bucket, :quoteid)'),
+        [{'bucket': bucket, 'quoteid': quoteid} for bucket, quoteid in keys]
+    )
+
+
+def remove(ids):
+    """ Drops deleted quotes from the index. The buckets are keyed by
+    bucket first, so they're found again from the stored signatures.
+    """
+    signatures = db.session.execute(
+        text('SELECT quoteid, signature FROM "dedupSignatures" WHERE quoteid IN :ids').
+            bindparams(bindparam('ids', expanding=True)),
+        {'ids': list(ids)}
+    ).fetchall()
+    keys = []
+    for quote_id, signature in signatures:
+        keys.extend({'bucket': bucket, 'quoteid': quote_id}
+                    for bucket in set(buckets(SIGNATURE.unpack(signature))))
+    if keys:
+        db.session.execute(
+            text('DELETE FROM "dedupBuckets" WHERE bucket = :bucket AND quoteid = :quoteid'),
+            keys
+        )
+    db.session.execute(
+        text('DELETE FROM "dedupSignatures" WHERE quoteid IN :ids').
+            bindparams(bindparam('ids', expanding=True)),
+        {'ids': list(ids)}
+    )
+
+
+def duplicates(ids):
+    """ {quote id: (duplicate id, similarity, duplicate approved)} for the
+    quotes among `ids` that were submitted as likely duplicates of a quote
+    that's still there
+    """
+    if not ids:
+        return {}
+    found = db.session.execute(
+        text('SELECT s.quoteid, s.duplicate_of, s.similarity, q.approved '
+             'FROM "dedupSignatures" s JOIN quotes q ON q.id = s.duplicate_of '
+             'WHERE s.quoteid IN :ids').
+            bindparams(bindparam('ids', expanding=True)),
+        {'ids': list(ids)}
+    ).fetchall()
+    return {id: (other, similarity, bool(approved))
+            for id, other, similarity, approved in found}
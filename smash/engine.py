@@ -0,0 +1,123 @@
+import sqlite3
+import threading
+
+import sqlalchemy
+from flask import has_request_context, request
+from flask_sqlalchemy import SQLAlchemy, SignallingSession, get_state
+from sqlalchemy import event, orm
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import QueuePool
+
+# Tuned for several gunicorn workers sharing one database file: WAL lets
+# readers run while a writer commits, and busy_timeout makes writers queue
+# for the lock instead of failing with "database is locked"
+PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 5000,
+    'cache_size': -16000,
+    'mmap_size': 268435456,
+    'temp_store': 'MEMORY',
+}
+POOL_SIZE = 5
+POOL_OVERFLOW = 10
+
+
+def pragmas(config):
+    """ The pragmas to run on new connections, with SQLITE_PRAGMAS overrides """
+    merged = dict(PRAGMAS)
+    merged.update(config.get('SQLITE_PRAGMAS', {}))
+    return merged
+
+
+def engine_options(config):
+    if not config['DATABASE_URL'].startswith('sqlite'):
+        return {}
+
+    busy_timeout = pragmas(config).get('busy_timeout', 0)
+    return {
+        'poolclass': QueuePool,
+        'pool_size': config.get('SQLITE_POOL_SIZE', POOL_SIZE),
+        'max_overflow': POOL_OVERFLOW,
+        'connect_args': {
+            # Pooled connections move between request and background threads
+            'check_same_thread': False,
+            'timeout': busy_timeout / 1000.0,
+        },
+    }
+
+
+# What set_pragmas() runs, from the config of the last install()
+statements = []
+
+
+def set_pragmas(dbapi_connection, connection_record):
+    if not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+    cursor = dbapi_connection.cursor()
+    for statement in statements:
+        cursor.execute(statement)
+    cursor.close()
+
+
+def install(config):
+    """ Applies the pragmas to every SQLite connection the app opens """
+    statements[:] = ["PRAGMA {} = {}".format(name, value)
+                     for name, value in pragmas(config).items()]
+    # Once per process, however often install() runs
+    if not event.contains(Engine, 'connect', set_pragmas):
+        event.listen(Engine, 'connect', set_pragmas)
+
+
+class RoutingSession(SignallingSession):
+    """ Sends the reads of GET requests to the read-only engine when
+    SQLITE_READ_ONLY_ENGINE is set; writes always go to the main engine.
+    """
+
+    def get_bind(self, mapper=None, clause=None):
+        if (self.app.config.get('SQLITE_READ_ONLY_ENGINE') and
+                not self._flushing and
+                has_request_context() and
+                request.method in ('GET', 'HEAD')):
+            return get_state(self.app).db.readonly_engine()
+        return SignallingSession.get_bind(self, mapper, clause)
+
+
+class Database(SQLAlchemy):
+    def __init__(self, *args, **kwargs):
+        self._readonly = None
+        self._readonly_lock = threading.Lock()
+        SQLAlchemy.__init__(self, *args, **kwargs)
+
+
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+
+    def readonly_engine(self):
+        """ A second engine on the same file whose connections refuse writes """
+        with self._readonly_lock:
+            if self._readonly is None:
+                app = self.get_app()
+                engine = sqlalchemy.create_engine(
+                    self.engine.url,
+                    **app.config['SQLALCHEMY_ENGINE_OPTIONS']
+                )
+
+                @event.listens_for(engine, 'connect')
+                def query_only(dbapi_connection, connection_record):
+                    dbapi_connection.execute("PRAGMA query_only = ON")
+
+                self._readonly = engine
+            return self._readonly
+
+
+    def begin_immediate(self):
+        """ Takes SQLite's write lock for the rest of the session's transaction,
+        so rows read before its first write can't change under it. A no-op if
+        the transaction has already written, and so already holds the lock.
+        """
+        dbapi_connection = self.session.connection().connection
+        if (isinstance(dbapi_connection.connection, sqlite3.Connection) and
+                not dbapi_connection.in_transaction):
+            self.session.execute("BEGIN IMMEDIATE")
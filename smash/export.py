@@ -0,0 +1,104 @@
+import csv
+import io
+import json
+import zlib
+from collections import defaultdict
+
+from smash import archive, db
+from smash.models_sqlalchemy import Quote, Tag, tags_to_quotes
+
+CHUNK = 500
+FIELDS = ['content', 'rating', 'authorIP', 'time', 'tags']
+MIMETYPES = {
+    'json': 'application/json',
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+
+def chunks(size=CHUNK, ascending=False, since=None, until=None):
+    """ Approved quotes, newest first unless `ascending`, as lists of export
+    records. `since` and `until` bound the quotes' unix times.
+
+    Walks the table by id in chunks, so only one chunk of rows is held in
+    memory at a time and no ORM objects pile up in the session.
+    """
+    last = None
+    while True:
+        rows = db.session.query(Quote.id, Quote.content, Quote.rating,
+                                Quote.author_ip, Quote.time).\
+                          filter(Quote.approved == True)
+        rows = archive.within(rows, since, until)
+        if last is not None:
+            rows = rows.filter(Quote.id > last if ascending else Quote.id < last)
+        order = Quote.id.asc() if ascending else Quote.id.desc()
+        rows = rows.order_by(order).limit(size).all()
+        if not rows:
+            return
+
+        tags = defaultdict(list)
+        for quoteid, name in db.session.query(tags_to_quotes.c.quoteid, Tag.name).\
+                                        join(Tag, Tag.id == tags_to_quotes.c.tagid).\
+                                        filter(tags_to_quotes.c.quoteid.in_([row.id for row in rows])):
+            tags[quoteid].append(name)
+
+        yield [{
+            'content': row.content,
+            'rating': row.rating,
+            'authorIP': row.author_ip,
+            'time': row.time,
+            'tags': tags[row.id],
+        } for row in rows]
+        last = rows[-1].id
+
+
+def as_json(records):
+    # Same bytes json.dumps() would give for the whole list
+    separator = '['
+    for chunk in records:
+        yield separator + ', '.join(json.dumps(record) for record in chunk)
+        separator = ', '
+    yield ']' if separator == ', ' else '[]'
+
+
+def as_ndjson(records):
+    for chunk in records:
+        yield ''.join(json.dumps(record) + '\n' for record in chunk)
+
+
+def as_csv(records):
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(FIELDS)
+    for chunk in records:
+        for record in chunk:
+            writer.writerow([record['content'], record['rating'],
+                             record['authorIP'], record['time'],
+                             ','.join(record['tags'])])
+        yield buf.getvalue()
+        buf.seek(0)
+        buf.truncate()
+    yield buf.getvalue()
+
+
+FORMATS = {
+    'json': as_json,
+    'ndjson': as_ndjson,
+    'csv': as_csv,
+}
+
+
+def gzipped(pieces):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for piece in pieces:
+        data = compressor.compress(piece.encode('utf-8'))
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def stream(fmt, compress=False, ascending=False, since=None, until=None):
+    pieces = FORMATS[fmt](chunks(ascending=ascending, since=since, until=until))
+    if compress:
+        return gzipped(pieces)
+    return (piece.encode('utf-8') for piece in pieces)
@@ -0,0 +1,196 @@
+import json
+import os
+import time
+from itertools import chain, islice
+
+from smash import cache, counters, db, dedup, readmodel, search, tagcloud
+from smash.models_sqlalchemy import hot_score, to_epoch
+
+BATCH = 5000
+READ_SIZE = 1 << 16
+
+
+def json_array(stream):
+    """ Yields the items of a JSON array one at a time without reading the
+    whole document into memory.
+    """
+    decoder = json.JSONDecoder()
+    buf = ''
+    pos = 0
+    started = False
+
+    while True:
+        # Skip whitespace, the opening bracket and the separating commas
+        while True:
+            while pos < len(buf) and buf[pos] in ' \t\r\n,[':
+                if buf[pos] == '[':
+                    if started:
+                        raise ValueError("Nested array at top level")
+                    started = True
+                pos += 1
+            if pos < len(buf):
+                break
+            more = stream.read(READ_SIZE)
+            if not more:
+                return
+            buf, pos = more, 0
+
+        if buf[pos] == ']':
+            return
+
+        error = None
+        try:
+            item, end = decoder.raw_decode(buf, pos)
+        except ValueError as e:
+            error, end = e, None
+        # A value running to the end of what's been read may go on in the
+        # next chunk, a number most of all, so decode it again with more
+        if end is None or end == len(buf):
+            more = stream.read(READ_SIZE)
+            if more:
+                buf, pos = buf[pos:] + more, 0
+                continue
+            if error is not None:
+                raise error
+
+        yield item
+        pos = end
+
+
+def ndjson(stream):
+    for line in stream:
+        if line.strip():
+            yield json.loads(line)
+
+
+def records(stream):
+    """ Reads the export_get() JSON array or NDJSON, telling them apart by
+    the first character.
+    """
+    first = stream.read(1)
+    while first and first.isspace():
+        first = stream.read(1)
+
+    if first == '[':
+        return json_array(stream)
+    return ndjson(chain([first + stream.readline()], stream))
+
+
+class Checkpoint(object):
+    """ Number of records already imported, kept in a small JSON file """
+
+    def __init__(self, path):
+        self.path = path
+        self.done = 0
+        if path and os.path.exists(path):
+            with open(path) as f:
+                self.done = json.load(f)['records']
+
+
+    def save(self, done):
+        self.done = done
+        if not self.path:
+            return
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump({'records': done}, f)
+        os.replace(tmp, self.path)
+
+
+def resolve_tags(cursor, tag_ids, names):
+    new = sorted(set(name for name in names if name not in tag_ids))
+    if not new:
+        return
+    cursor.executemany("INSERT OR IGNORE INTO tags (name) VALUES (?)",
+                       [(name,) for name in new])
+    for i in range(0, len(new), 500):
+        chunk = new[i:i + 500]
+        cursor.execute(
+            "SELECT id, name FROM tags WHERE name IN ({})".format(
+                ','.join('?' * len(chunk))),
+            chunk
+        )
+        tag_ids.update((name, id) for id, name in cursor.fetchall())
+
+
+def write_batch(connection, tag_ids, batch):
+    cursor = connection.cursor()
+    # Take the write lock up front so the ids handed out below stay ours
+    cursor.execute("BEGIN IMMEDIATE")
+    try:
+        cursor.execute("SELECT coalesce(max(id), 0) FROM quotes")
+        next_id = cursor.fetchone()[0] + 1
+
+        resolve_tags(cursor, tag_ids,
+                     [tag for record in batch for tag in record.get('tags', []) if tag])
+
+        quotes = []
+        links = []
+        for quote_id, record in enumerate(batch, next_id):
+            try:
+                created = to_epoch(record['time'])
+            except (KeyError, ValueError):
+                created = None
+            rating = record.get('rating') or 0
+            quotes.append((quote_id, rating, record['content'],
+                           True, record.get('authorIP', ''), record.get('time', ''),
+                           created, hot_score(rating, created)))
+            for tag in set(record.get('tags', [])):
+                if tag:
+                    links.append((tag_ids[tag], quote_id))
+
+        cursor.executemany(
+            "INSERT INTO quotes (id, rating, content, approved, author_ip, time, created, hot) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            quotes
+        )
+        cursor.executemany(
+            'INSERT INTO "tagsToQuotes" (tagid, quoteid) VALUES (?, ?)',
+            links
+        )
+        readmodel.write_changes(cursor, [quote[0] for quote in quotes])
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+
+
+def run(stream, checkpoint=None, batch_size=BATCH, progress=None):
+    """ Imports approved quotes in batched transactions, returns how many.
+
+    With a checkpoint file, every committed batch is recorded there and a
+    rerun skips what's already in the database. The duplicate index is
+    filled in afterwards, so the batches only write the quotes and links.
+    """
+    checkpoint = Checkpoint(checkpoint)
+    items = islice(records(stream), checkpoint.done, None)
+
+    connection = db.engine.raw_connection()
+    imported = 0
+    try:
+        cursor = connection.cursor()
+        cursor.execute("SELECT name, id FROM tags")
+        tag_ids = dict(cursor.fetchall())
+
+        started = time.time()
+        while True:
+            batch = list(islice(items, batch_size))
+            if not batch:
+                break
+            write_batch(connection, tag_ids, batch)
+            imported += len(batch)
+            checkpoint.save(checkpoint.done + len(batch))
+            if progress is not None:
+                progress(imported, time.time() - started)
+        dedup.index_missing(connection)
+    finally:
+        connection.close()
+
+    # Bring the derived tables back in line with the new rows
+    counters.rebuild()
+    search.rebuild()
+    tagcloud.invalidate()
+    cache.invalidate()
+    db.session.commit()
+
+    return imported
@@ -0,0 +1,176 @@
+import atexit
+import logging
+import os
+import threading
+import time
+
+from flask import current_app
+
+from smash import conf, counters, db, dedup, metrics
+from smash.models_sqlalchemy import Quote, Tag, tags_to_quotes
+
+logger = logging.getLogger(__name__)
+
+
+class Submission(object):
+    """ A quote sent to /add or /slack, waiting to be stored """
+
+    def __init__(self, content, author_ip, time, tags=()):
+        self.content = content
+        self.author_ip = author_ip
+        self.time = time
+        # Tags in the order given, without blanks or repeats
+        self.tags = list(dict.fromkeys(tag.strip() for tag in tags if tag.strip()))
+
+
+def resolve_tags(names):
+    """ {name: tag id} for the names, adding the missing tags in one insert """
+    if not names:
+        return {}
+    tags = Tag.__table__
+    ids = dict(db.session.execute(
+        db.select([tags.c.name, tags.c.id]).where(tags.c.name.in_(names))
+    ).fetchall())
+    missing = [name for name in names if name not in ids]
+    if missing:
+        # Another worker may add the same tag first
+        db.session.execute(tags.insert().prefix_with('OR IGNORE'),
+                           [{'name': name} for name in missing])
+        ids.update(db.session.execute(
+            db.select([tags.c.name, tags.c.id]).where(tags.c.name.in_(missing))
+        ).fetchall())
+    return ids
+
+
+def write(submissions):
+    """ Stores submissions for moderation in one transaction, returns the
+    number stored. Exact repeats are skipped when DEDUP_REJECT_EXACT is on.
+    """
+    tag_ids = resolve_tags(list(dict.fromkeys(
+        name for submission in submissions for name in submission.tags)))
+
+    stored = 0
+    links = []
+    for submission in submissions:
+        # Checked one by one, so repeats within a batch are found too
+        sketch = dedup.Sketch(submission.content)
+        match = dedup.find(sketch)
+        if dedup.rejected(match):
+            continue
+        quote = Quote(submission.content, submission.author_ip, submission.time)
+        db.session.add(quote)
+        db.session.flush()
+        dedup.add(quote.id, sketch, match)
+        links.extend({'tagid': tag_ids[name], 'quoteid': quote.id}
+                     for name in submission.tags)
+        stored += 1
+
+    if links:
+        db.session.execute(tags_to_quotes.insert(), links)
+    if stored:
+        counters.incr(counters.PENDING, stored)
+    db.session.commit()
+    return stored
+
+
+class IngestQueue(object):
+    """ Holds submissions in process and writes them in one transaction
+    every `interval` seconds. Holds at most `size`: the request that fills
+    it writes the batch itself, which slows submitters down instead of
+    dropping anything.
+    """
+
+    def __init__(self, interval, size):
+        self.interval = interval
+        self.size = size
+        self.pending = []
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.thread = None
+        self.pid = None
+        self.app = None
+
+
+    def __len__(self):
+        return len(self.pending)
+
+
+    def add(self, submission):
+        self.start()
+        with self.lock:
+            self.pending.append(submission)
+            full = len(self.pending) >= self.size
+        if full:
+            self.flush()
+
+
+    def flush(self):
+        with self.flush_lock:
+            with self.lock:
+                batch, self.pending = self.pending, []
+            if not batch:
+                return
+            started = time.perf_counter()
+            with self.app.app_context():
+                try:
+                    write(batch)
+                except Exception:
+                    db.session.rollback()
+                    logger.exception("Writing %d submissions failed, retrying one by one", len(batch))
+                    self.write_each(batch)
+            flush_seconds.observe('submissions', time.perf_counter() - started)
+
+
+    def write_each(self, batch):
+        # One bad submission shouldn't take the rest of its batch with it
+        for submission in batch:
+            try:
+                write([submission])
+            except Exception:
+                db.session.rollback()
+                logger.exception("Dropped a submission from %s", submission.author_ip)
+
+
+    def start(self):
+        # Started lazily so every forked gunicorn worker runs its own writer
+        if self.pid == os.getpid() and self.thread.is_alive():
+            return
+        with self.lock:
+            if self.pid == os.getpid() and self.thread.is_alive():
+                return
+            self.pid = os.getpid()
+            self.app = current_app._get_current_object()
+            self.thread = threading.Thread(target=self.run, daemon=True)
+            self.thread.start()
+
+
+    def run(self):
+        while True:
+            time.sleep(self.interval)
+            self.flush()
+
+
+queue = None
+if conf.config.get('INGEST_BATCH_MS'):
+    queue = IngestQueue(conf.config['INGEST_BATCH_MS'] / 1000.0,
+                        conf.config.get('INGEST_QUEUE_SIZE', 100))
+    atexit.register(queue.flush)
+    metrics.gauge('quips_ingest_queue_depth',
+                  'Submissions waiting to be written', lambda: len(queue))
+    flush_seconds = metrics.histogram('quips_ingest_flush_seconds',
+                                      'Time taken to write a batch of submissions',
+                                      metrics.SECONDS, label='queue')
+
+
+def submit(content, author_ip, time, tags=()):
+    """ Stores a new quote for moderation, or queues it when INGEST_BATCH_MS
+    is set. Returns False if it was turned away as a repeat.
+    """
+    submission = Submission(content, author_ip, time, tags)
+    if queue is None:
+        return write([submission]) > 0
+
+    if dedup.REJECT_EXACT and dedup.rejected(dedup.find(dedup.Sketch(content))):
+        return False
+    queue.add(submission)
+    return True
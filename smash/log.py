@@ -2,6 +2,9 @@ import logging
 
 def configure_logging():
     root = logging.getLogger()
+    # create_app() runs once per app; one handler is enough for all of them
+    if root.handlers:
+        return root
     root.setLevel(logging.DEBUG)
     formatter = logging.Formatter("[%(levelname)s] - %(asctime)s - %(name)s -"
                                   " %(message)s")
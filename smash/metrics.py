@@ -0,0 +1,226 @@
+import threading
+import time
+from bisect import bisect_left
+
+from flask import Response, abort, g, has_request_context, request, session
+from jinja2 import Template
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from smash import conf, ratelimit
+
+SECONDS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERIES = (0, 1, 2, 3, 5, 8, 13, 21, 50, 100)
+
+
+class Histogram(object):
+    """ Prometheus histogram with one series per route, or per value of
+    another label
+    """
+
+    def __init__(self, name, help, buckets, label='route'):
+        self.name = name
+        self.help = help
+        self.buckets = buckets
+        self.label = label
+        self.series = {}
+        self.lock = threading.Lock()
+
+
+    def observe(self, route, value):
+        with self.lock:
+            series = self.series.get(route)
+            if series is None:
+                # A count per bucket, one for +Inf, then the sum
+                series = self.series[route] = [0] * (len(self.buckets) + 2)
+            series[bisect_left(self.buckets, value)] += 1
+            series[-1] += value
+
+
+    def expose(self):
+        lines = [
+            '# HELP {} {}'.format(self.name, self.help),
+            '# TYPE {} histogram'.format(self.name),
+        ]
+        with self.lock:
+            series = sorted((route, list(values)) for route, values in self.series.items())
+        for route, values in series:
+            total = 0
+            for bound, count in zip(self.buckets + ('+Inf',), values):
+                total += count
+                lines.append('{}_bucket{{{}="{}",le="{}"}} {}'.format(
+                    self.name, self.label, route, bound, total))
+            lines.append('{}_sum{{{}="{}"}} {}'.format(self.name, self.label, route, values[-1]))
+            lines.append('{}_count{{{}="{}"}} {}'.format(self.name, self.label, route, total))
+        return lines
+
+
+class Counter(object):
+    """ Prometheus counter labelled by route and status """
+
+    def __init__(self, name, help):
+        self.name = name
+        self.help = help
+        self.values = {}
+        self.lock = threading.Lock()
+
+
+    def inc(self, route, status):
+        with self.lock:
+            key = (route, status)
+            self.values[key] = self.values.get(key, 0) + 1
+
+
+    def expose(self):
+        lines = [
+            '# HELP {} {}'.format(self.name, self.help),
+            '# TYPE {} counter'.format(self.name),
+        ]
+        with self.lock:
+            values = sorted(self.values.items())
+        for (route, status), value in values:
+            lines.append('{}{{route="{}",status="{}"}} {}'.format(
+                self.name, route, status, value))
+        return lines
+
+
+class Gauge(object):
+    """ Prometheus gauge read from a function when scraped """
+
+    def __init__(self, name, help, read):
+        self.name = name
+        self.help = help
+        self.read = read
+
+
+    def expose(self):
+        return [
+            '# HELP {} {}'.format(self.name, self.help),
+            '# TYPE {} gauge'.format(self.name),
+            '{} {}'.format(self.name, self.read()),
+        ]
+
+
+request_seconds = Histogram('quips_request_seconds',
+                            'Time spent handling a request', SECONDS)
+db_seconds = Histogram('quips_request_db_seconds',
+                       'Time a request spent waiting on SQL statements', SECONDS)
+render_seconds = Histogram('quips_request_render_seconds',
+                           'Time a request spent rendering templates', SECONDS)
+queries = Histogram('quips_request_queries',
+                    'SQL statements sent by a request', QUERIES)
+responses = Counter('quips_responses_total', 'Responses sent')
+registry = [request_seconds, db_seconds, render_seconds, queries, responses,
+            Gauge('quips_ratelimit_refused', 'Hits refused because the rate limit table was full',
+                  lambda: ratelimit.refused)]
+
+
+def gauge(name, help, read):
+    """ Adds a value for /metrics to read when scraped """
+    registry.append(Gauge(name, help, read))
+
+
+def histogram(name, help, buckets, label='route'):
+    """ Adds a histogram to /metrics and returns it """
+    metric = Histogram(name, help, buckets, label)
+    registry.append(metric)
+    return metric
+
+
+class Timing(object):
+    """ Where the time of the current request went """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.db = 0.0
+        self.queries = 0
+        self.render = 0.0
+
+
+def current():
+    if has_request_context():
+        return g.get('timing')
+    return None
+
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info['query_started'].pop()
+    timing = current()
+    if timing is not None:
+        timing.db += time.perf_counter() - started
+        timing.queries += 1
+
+
+def handle_error(context):
+    # A failed statement never reaches after_cursor_execute
+    if context.connection is not None and context.cursor is not None:
+        started = context.connection.info.get('query_started')
+        if started:
+            started.pop()
+
+
+class TimedTemplate(Template):
+    """ Adds the time spent rendering to the current request """
+
+    def render(self, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return super(TimedTemplate, self).render(*args, **kwargs)
+        finally:
+            timing = current()
+            if timing is not None:
+                timing.render += time.perf_counter() - started
+
+
+def before_request():
+    g.timing = Timing()
+
+
+def after_request(response):
+    timing = g.get('timing')
+    if timing is None:
+        return response
+    total = time.perf_counter() - timing.started
+    route = request.endpoint or 'unmatched'
+
+    request_seconds.observe(route, total)
+    db_seconds.observe(route, timing.db)
+    render_seconds.observe(route, timing.render)
+    queries.observe(route, timing.queries)
+    responses.inc(route, response.status_code)
+
+    if conf.config.get('SERVER_TIMING', True):
+        # Streamed bodies (/export) are produced after this, so only their
+        # first statements show up here
+        response.headers['Server-Timing'] = (
+            'db;dur={:.2f};desc="{} queries", render;dur={:.2f}, app;dur={:.2f}'.format(
+                timing.db * 1000, timing.queries, timing.render * 1000, total * 1000)
+        )
+    return response
+
+
+def metrics():
+    """ Prometheus text exposition of this worker's metrics """
+    if not session.get('authorized'):
+        abort(403)
+
+    lines = []
+    for metric in registry:
+        lines.extend(metric.expose())
+    return Response('\n'.join(lines) + '\n',
+                    mimetype='text/plain; version=0.0.4')
+
+
+def init_app(app):
+    if not event.contains(Engine, 'before_cursor_execute', before_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', after_cursor_execute)
+        event.listen(Engine, 'handle_error', handle_error)
+    app.jinja_env.template_class = TimedTemplate
+    app.before_request(before_request)
+    app.after_request(after_request)
+    app.add_url_rule('/metrics', 'metrics', metrics)
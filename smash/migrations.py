@@ -0,0 +1,254 @@
+import logging
+
+from smash import db, dedup
+from smash.models_sqlalchemy import hot_score, to_epoch
+
+logger = logging.getLogger(__name__)
+
+
+def add_listing_indexes(cursor):
+    """ Indexes behind the listing, count and seek queries """
+    cursor.execute("CREATE INDEX IF NOT EXISTS ix_quotes_approved_id "
+                   "ON quotes (approved, id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS ix_quotes_approved_rating_id "
+                   "ON quotes (approved, rating, id)")
+
+
+def add_tag_link_indexes(cursor):
+    """ Makes tagsToQuotes pairs unique and indexes both directions """
+    cursor.execute('DELETE FROM "tagsToQuotes" WHERE rowid NOT IN '
+                   '(SELECT min(rowid) FROM "tagsToQuotes" GROUP BY tagid, quoteid)')
+    cursor.execute('CREATE UNIQUE INDEX IF NOT EXISTS ux_tagsToQuotes_tagid_quoteid '
+                   'ON "tagsToQuotes" (tagid, quoteid)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS ix_tagsToQuotes_quoteid_tagid '
+                   'ON "tagsToQuotes" (quoteid, tagid)')
+
+
+def add_created_column(cursor, batch=1000):
+    """ Adds quotes.created and backfills it from the time strings """
+    cursor.execute("PRAGMA table_info(quotes)")
+    if 'created' not in [column[1] for column in cursor.fetchall()]:
+        cursor.execute("ALTER TABLE quotes ADD COLUMN created INTEGER")
+
+    last = 0
+    while True:
+        cursor.execute("SELECT id, time FROM quotes WHERE id > ? AND created IS NULL "
+                       "ORDER BY id LIMIT ?", (last, batch))
+        rows = cursor.fetchall()
+        if not rows:
+            break
+        updates = []
+        for id, time in rows:
+            try:
+                updates.append((to_epoch(time), id))
+            except ValueError:
+                logger.warning("Quote %d has an unreadable time %r", id, time)
+        cursor.executemany("UPDATE quotes SET created = ? WHERE id = ?", updates)
+        last = rows[-1][0]
+
+    cursor.execute("CREATE INDEX IF NOT EXISTS ix_quotes_approved_created_id "
+                   "ON quotes (approved, created, id)")
+
+
+def add_hot_column(cursor, batch=1000):
+    """ Adds quotes.hot, the /hot ranking, and the table of quotes to rescore """
+    cursor.execute("PRAGMA table_info(quotes)")
+    if 'hot' not in [column[1] for column in cursor.fetchall()]:
+        cursor.execute("ALTER TABLE quotes ADD COLUMN hot INTEGER NOT NULL DEFAULT 0")
+    cursor.execute('CREATE TABLE IF NOT EXISTS "hotDirty" '
+                   '(quoteid INTEGER NOT NULL PRIMARY KEY)')
+
+    last = 0
+    while True:
+        cursor.execute("SELECT id, rating, created FROM quotes WHERE id > ? "
+                       "ORDER BY id LIMIT ?", (last, batch))
+        rows = cursor.fetchall()
+        if not rows:
+            break
+        cursor.executemany("UPDATE quotes SET hot = ? WHERE id = ?",
+                           [(hot_score(rating, created), id) for id, rating, created in rows])
+        last = rows[-1][0]
+
+    cursor.execute("CREATE INDEX IF NOT EXISTS ix_quotes_approved_hot_id "
+                   "ON quotes (approved, hot, id)")
+
+
+def add_dedup_index(cursor, batch=1000):
+    """ Adds the near-duplicate index and fills it from every quote """
+    cursor.execute('CREATE TABLE IF NOT EXISTS "dedupSignatures" ('
+                   'quoteid INTEGER NOT NULL PRIMARY KEY, '
+                   'exact INTEGER NOT NULL, '
+                   'signature BLOB NOT NULL, '
+                   'duplicate_of INTEGER, '
+                   'similarity FLOAT)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS ix_dedupSignatures_exact '
+                   'ON "dedupSignatures" (exact)')
+    cursor.execute('CREATE TABLE IF NOT EXISTS "dedupBuckets" ('
+                   'bucket INTEGER NOT NULL, '
+                   'quoteid INTEGER NOT NULL, '
+                   'PRIMARY KEY (bucket, quoteid)) WITHOUT ROWID')
+
+    last = 0
+    while True:
+        cursor.execute("SELECT id, content FROM quotes WHERE id > ? "
+                       "ORDER BY id LIMIT ?", (last, batch))
+        rows = cursor.fetchall()
+        if not rows:
+            break
+        dedup.write(cursor, [(id, dedup.Sketch(content)) for id, content in rows])
+        last = rows[-1][0]
+
+
+def add_change_sequence(cursor):
+    """ Adds quoteChanges, which read models follow to stay current """
+    cursor.execute('CREATE TABLE IF NOT EXISTS "quoteChanges" ('
+                   'quoteid INTEGER NOT NULL PRIMARY KEY, '
+                   'seq INTEGER NOT NULL)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS ix_quoteChanges_seq '
+                   'ON "quoteChanges" (seq)')
+
+
+def add_search_index(cursor):
+    """ Adds quotes_fts, the full-text index behind /search, and fills it """
+    cursor.execute("CREATE VIRTUAL TABLE IF NOT EXISTS quotes_fts USING fts5(content)")
+    # Databases from before this step may have built it at startup already
+    cursor.execute("DELETE FROM quotes_fts")
+    cursor.execute("INSERT INTO quotes_fts (rowid, content) "
+                   "SELECT id, content FROM quotes WHERE approved = 1")
+
+
+# Append only: a deployed database has run every step up to its user_version
+MIGRATIONS = [
+    add_listing_indexes,
+    add_tag_link_indexes,
+    add_created_column,
+    add_hot_column,
+    add_dedup_index,
+    add_change_sequence,
+    add_search_index,
+]
+
+# (name, SQL, parameters, expected plan): every expected (table, index)
+# step must appear in the plan, in this order. These are the statements
+# the routes still send to SQLite rather than the read model; the archive's
+# month list groups on a computed key, so it always sorts and isn't here.
+HOT_QUERIES = [
+    ("hot page",
+     "SELECT * FROM quotes WHERE approved = 1 "
+     "ORDER BY hot DESC, id DESC LIMIT ? OFFSET ?", (10, 0),
+     [("quotes", "ix_quotes_approved_hot_id")]),
+    ("hot boundary",
+     "SELECT hot, id FROM quotes WHERE approved = 1 "
+     "ORDER BY hot DESC, id DESC LIMIT ? OFFSET ?", (1, 100),
+     [("quotes", "ix_quotes_approved_hot_id")]),
+    ("hot seek",
+     "SELECT * FROM quotes WHERE approved = 1 AND (hot, id) < (?, ?) "
+     "ORDER BY hot DESC, id DESC LIMIT ? OFFSET ?", (1609459200, 100, 10, 0),
+     [("quotes", "ix_quotes_approved_hot_id")]),
+    ("archive count",
+     "SELECT count(id) FROM quotes WHERE approved = 1 AND created >= ? AND created < ?",
+     (1609459200, 1612137600),
+     [("quotes", "ix_quotes_approved_created_id")]),
+    ("archive seek",
+     "SELECT * FROM quotes WHERE approved = 1 AND created >= ? AND created < ? "
+     "AND (created, id) < (?, ?) ORDER BY created DESC, id DESC LIMIT ? OFFSET ?",
+     (1609459200, 1612137600, 1610000000, 100, 10, 0),
+     [("quotes", "ix_quotes_approved_created_id")]),
+    ("search count",
+     "SELECT count(*) FROM quotes_fts WHERE quotes_fts MATCH ?", ('quote',), []),
+    # ORDER BY rank, bm25() by default, leaves the sort to FTS5
+    ("search page",
+     "SELECT quotes_fts.rowid FROM quotes_fts WHERE quotes_fts MATCH ? "
+     "ORDER BY rank LIMIT ? OFFSET ?", ('quote', 10, 0), []),
+    ("search in dates",
+     "SELECT quotes_fts.rowid FROM quotes_fts JOIN quotes ON quotes.id = quotes_fts.rowid "
+     "WHERE quotes_fts MATCH ? AND quotes.created >= ? AND quotes.created < ? "
+     "ORDER BY rank LIMIT ? OFFSET ?", ('quote', 1, 2, 10, 0),
+     [("quotes", "PRIMARY KEY")]),
+    ("page by id",
+     "SELECT * FROM quotes WHERE id IN (?, ?, ?) AND approved = 1", (1, 2, 3),
+     [("quotes", "PRIMARY KEY")]),
+    ("tags of a page",
+     'SELECT quotes.id, tags.id, tags.name FROM quotes JOIN "tagsToQuotes" '
+     'ON quotes.id = "tagsToQuotes".quoteid JOIN tags ON tags.id = "tagsToQuotes".tagid '
+     'WHERE quotes.id IN (?, ?, ?)', (1, 2, 3),
+     [("tagsToQuotes", "ix_tagsToQuotes_quoteid_tagid"), ("tags", "PRIMARY KEY")]),
+    ("queue seek",
+     "SELECT * FROM quotes WHERE approved = 0 AND id > ? ORDER BY id ASC LIMIT ? OFFSET ?",
+     (100, 50, 0),
+     [("quotes", "ix_quotes_approved_id")]),
+    ("queue duplicates",
+     'SELECT s.quoteid, s.duplicate_of, s.similarity, q.approved FROM "dedupSignatures" s '
+     'JOIN quotes q ON q.id = s.duplicate_of WHERE s.quoteid IN (?, ?, ?)', (1, 2, 3),
+     [("s", "PRIMARY KEY"), ("q", "PRIMARY KEY")]),
+    # ReadModel.load() walks every link of an approved quote in quote order
+    ("tag links",
+     'SELECT l.tagid, l.quoteid FROM "tagsToQuotes" l '
+     'JOIN quotes q ON q.id = l.quoteid WHERE q.approved = 1 ORDER BY q.id', (),
+     [("q", "ix_quotes_approved_id"), ("l", "ix_tagsToQuotes_quoteid_tagid")]),
+]
+
+
+def version(cursor):
+    cursor.execute("PRAGMA user_version")
+    return cursor.fetchone()[0]
+
+
+def upgrade():
+    """ Runs the migrations a database hasn't seen yet, returns
+    (old version, new version).
+
+    All steps run in one write transaction, so workers booting at the same
+    time can't upgrade the same file twice.
+    """
+    connection = db.engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        cursor.execute("BEGIN IMMEDIATE")
+        try:
+            old = version(cursor)
+            for number, step in enumerate(MIGRATIONS[old:], old + 1):
+                logger.info("Migration %d: %s", number, step.__doc__.strip())
+                step(cursor)
+            # PRAGMA doesn't take bound parameters
+            cursor.execute("PRAGMA user_version = {:d}".format(len(MIGRATIONS)))
+            connection.commit()
+        except Exception:
+            connection.rollback()
+            raise
+    finally:
+        connection.close()
+    return old, max(old, len(MIGRATIONS))
+
+
+def follows(plan, expected):
+    """ Whether the plan searches each (table, index) of `expected`, in order """
+    lines = iter(plan)
+    return all(
+        any(line.startswith('SEARCH {} '.format(table)) and index in line
+            for line in lines)
+        for table, index in expected
+    )
+
+
+def explain():
+    """ [(name, plan lines, ok)] for every hot query. A query is flagged
+    when SQLite has to scan a table or sort rows to answer it, or doesn't
+    take the steps its entry in HOT_QUERIES expects.
+    """
+    connection = db.engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        report = []
+        for name, sql, params, expected in HOT_QUERIES:
+            cursor.execute("EXPLAIN QUERY PLAN " + sql, params)
+            plan = [row[-1] for row in cursor.fetchall()]
+            ok = follows(plan, expected) and not any(
+                (line.startswith('SCAN') and 'INDEX' not in line)
+                or 'TEMP B-TREE' in line
+                for line in plan
+            )
+            report.append((name, plan, ok))
+        return report
+    finally:
+        connection.close()
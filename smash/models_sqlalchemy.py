@@ -1,15 +1,84 @@
-from smash import db
+import datetime
+import math
+import time as _time
+
+from smash import db, render
+
+TIME_FORMAT = "%H:%M:%S %m/%d/%Y"
+# Seconds a quote moves up /hot for every 10x its net votes
+HOT_DECAY = 45000
+
+
+def to_epoch(ts):
+    """ Converts a TIME_FORMAT string in local time to a unix time """
+    return int(_time.mktime(datetime.datetime.strptime(ts, TIME_FORMAT).timetuple()))
+
+
+def hot_score(rating, created):
+    """ Rank of a quote on /hot, in seconds: its submission time moved
+    HOT_DECAY forward (or back) per order of magnitude of its rating.
+
+    Newer quotes start higher, so old ones sink without ever having to be
+    rescored; only votes change a score.
+    """
+    rating = rating or 0
+    order = math.log10(max(abs(rating), 1))
+    sign = (rating > 0) - (rating < 0)
+    return int((created or 0) + sign * order * HOT_DECAY)
 
 
 tags_to_quotes = db.Table(
     'tagsToQuotes',
     db.Column('tagid', db.Integer, db.ForeignKey('tags.id')),
-    db.Column('quoteid', db.Integer, db.ForeignKey('quotes.id'))
+    db.Column('quoteid', db.Integer, db.ForeignKey('quotes.id')),
+    db.Index('ux_tagsToQuotes_tagid_quoteid', 'tagid', 'quoteid', unique=True),
+    db.Index('ix_tagsToQuotes_quoteid_tagid', 'quoteid', 'tagid')
+)
+
+# Quotes voted on since their hot score was last computed
+hot_dirty = db.Table(
+    'hotDirty',
+    db.Column('quoteid', db.Integer, primary_key=True)
+)
+
+# Near-duplicate index of smash/dedup.py: a MinHash signature per quote,
+# and the LSH buckets it falls in
+dedup_signatures = db.Table(
+    'dedupSignatures',
+    db.Column('quoteid', db.Integer, primary_key=True),
+    db.Column('exact', db.Integer, nullable=False),
+    db.Column('signature', db.LargeBinary, nullable=False),
+    db.Column('duplicate_of', db.Integer),
+    db.Column('similarity', db.Float),
+    db.Index('ix_dedupSignatures_exact', 'exact')
+)
+
+dedup_buckets = db.Table(
+    'dedupBuckets',
+    db.Column('bucket', db.Integer, primary_key=True, autoincrement=False),
+    db.Column('quoteid', db.Integer, primary_key=True, autoincrement=False),
+    sqlite_with_rowid=False
+)
+
+# The last change to each quote's approval, rating or existence, numbered
+# in commit order, for the read model of smash/readmodel.py to catch up on
+quote_changes = db.Table(
+    'quoteChanges',
+    db.Column('quoteid', db.Integer, primary_key=True, autoincrement=False),
+    db.Column('seq', db.Integer, nullable=False),
+    db.Index('ix_quoteChanges_seq', 'seq')
 )
 
 
 class Quote(db.Model):
     __tablename__ = 'quotes'
+    # Kept in step with smash/migrations.py, which adds them to old databases
+    __table_args__ = (
+        db.Index('ix_quotes_approved_id', 'approved', 'id'),
+        db.Index('ix_quotes_approved_rating_id', 'approved', 'rating', 'id'),
+        db.Index('ix_quotes_approved_created_id', 'approved', 'created', 'id'),
+        db.Index('ix_quotes_approved_hot_id', 'approved', 'hot', 'id'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     rating = db.Column(db.Integer)
@@ -17,6 +86,10 @@ class Quote(db.Model):
     approved = db.Column(db.Boolean)
     author_ip = db.Column(db.String(), nullable=False)
     time = db.Column(db.String(), nullable=False)
+    # Unix time of `time`, for sorting and range scans
+    created = db.Column(db.Integer)
+    # hot_score() of rating and created, refreshed by smash/ranking.py
+    hot = db.Column(db.Integer, nullable=False, server_default='0')
     tags = db.relationship(
         'Tag',
         secondary=tags_to_quotes,
@@ -30,6 +103,14 @@ class Quote(db.Model):
         self.approved = False
         self.author_ip = author_ip
         self.time = time
+        self.created = to_epoch(time)
+        self.hot = hot_score(self.rating, self.created)
+
+
+    @property
+    def html(self):
+        """ Escaped HTML of the quote body, rendered once per content """
+        return render.quote_html(self)
 
 
 class Tag(db.Model):
@@ -41,3 +122,15 @@ class Tag(db.Model):
 
     def __init__(self, name):
         self.name = name
+
+
+class Counter(db.Model):
+    __tablename__ = 'counters'
+
+    name = db.Column(db.String(), primary_key=True)
+    value = db.Column(db.Integer, nullable=False)
+
+
+    def __init__(self, name, value):
+        self.name = name
+        self.value = value
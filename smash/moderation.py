@@ -0,0 +1,65 @@
+from sqlalchemy import and_, exists
+
+from smash import cache, counters, db, dedup, readmodel, search, tagcloud
+from smash.models_sqlalchemy import Quote, Tag, tags_to_quotes
+
+
+def approve(ids):
+    """ Approves the pending quotes among `ids` in one transaction.
+
+    Returns the number of quotes approved.
+    """
+    # Another worker approving or deleting the same quotes between the read
+    # and the update would otherwise have them counted twice
+    db.begin_immediate()
+    pending = Quote.query.filter(Quote.id.in_(ids), Quote.approved.isnot(True))
+    ids = [id for id, in pending.with_entities(Quote.id)]
+    if not ids:
+        db.session.rollback()
+        return 0
+
+    counters.approve(ids)
+    pending.update({Quote.approved: True}, synchronize_session=False)
+    search.index(ids)
+    readmodel.changed(ids)
+    tagcloud.invalidate()
+    cache.invalidate()
+    db.session.commit()
+    return len(ids)
+
+
+def delete(ids):
+    """ Deletes the quotes among `ids`, and the tags left without quotes,
+    in one transaction. Returns the number of quotes deleted.
+    """
+    db.begin_immediate()
+    rows = db.session.query(Quote.id, Quote.approved).filter(Quote.id.in_(ids)).all()
+    if not rows:
+        db.session.rollback()
+        return 0
+    ids = [id for id, _ in rows]
+    approved = [id for id, flag in rows if flag]
+
+    counters.discard(approved, [id for id, flag in rows if not flag])
+    search.remove(ids)
+    dedup.remove(ids)
+    readmodel.changed(approved)
+
+    links = tags_to_quotes
+    tagids = [tagid for tagid, in db.session.query(links.c.tagid).
+                                            filter(links.c.quoteid.in_(ids)).
+                                            distinct()]
+    db.session.execute(links.delete().where(links.c.quoteid.in_(ids)))
+    Quote.query.filter(Quote.id.in_(ids)).delete(synchronize_session=False)
+
+    if tagids:
+        tags = Tag.__table__
+        dangling = and_(tags.c.id.in_(tagids),
+                        ~exists().where(links.c.tagid == tags.c.id))
+        db.session.execute(tags.delete().where(dangling))
+
+    if approved:
+        tagcloud.invalidate()
+        cache.invalidate()
+    db.session.commit()
+    return len(ids)
@@ -0,0 +1,100 @@
+from sqlalchemy import tuple_
+from sqlalchemy.sql.expression import func
+
+PER_PAGE = 10
+
+
+class Keyset(object):
+    """ A unique ordering of a listing that can be seeked into by value """
+
+    def __init__(self, *columns, descending=True):
+        self.columns = columns
+        self.descending = descending
+
+
+    def order_by(self):
+        if self.descending:
+            return [column.desc() for column in self.columns]
+        return [column.asc() for column in self.columns]
+
+
+    def after(self, values):
+        # Row values, (a, b) < (x, y), let SQLite seek straight into the
+        # index; the equivalent OR of comparisons makes it walk from the top
+        if len(self.columns) == 1:
+            key, values = self.columns[0], values[0]
+        else:
+            key, values = tuple_(*self.columns), tuple_(*values)
+        if self.descending:
+            return key < values
+        return key > values
+
+
+    def boundary(self, query, offset):
+        """ Key of the row right before the given offset, read off the index """
+        return query.with_entities(*self.columns).\
+                     order_by(*self.order_by()).\
+                     offset(offset - 1).limit(1).first()
+
+
+    def cursor(self, row):
+        return '.'.join(str(getattr(row, column.key)) for column in self.columns)
+
+
+    def parse_cursor(self, cursor):
+        try:
+            values = tuple(int(value) for value in cursor.split('.'))
+        except (AttributeError, ValueError):
+            return None
+        if len(values) != len(self.columns):
+            return None
+        return values
+
+
+class Page(object):
+    def __init__(self, items, total, number, keyset, per_page=PER_PAGE,
+                 numpages=None):
+        self.items = items
+        self.total = total
+        self.number = number
+        self.keyset = keyset
+        self.per_page = per_page
+        if numpages is None:
+            numpages = -(-total // per_page)
+        self.numpages = max(1, numpages)
+
+
+    @property
+    def next_cursor(self):
+        if self.keyset is None or len(self.items) < self.per_page:
+            return None
+        return self.keyset.cursor(self.items[-1])
+
+
+def count(query, keyset):
+    return query.order_by(None).\
+                 with_entities(func.count(keyset.columns[-1])).scalar()
+
+
+def paginate(query, keyset, number, cursor=None, total=None, per_page=PER_PAGE):
+    """ Fetches one page of `query` in `keyset` order.
+
+    Deep pages seek past the last key of the previous page instead of
+    making SQLite skip over (and us hydrate) every row before them. The key
+    comes from the `cursor` of the previous page when the client has it,
+    otherwise from a single offset lookup over the ordering columns only.
+    """
+    if total is None:
+        total = count(query, keyset)
+
+    ordered = query.order_by(*keyset.order_by())
+    if number > 1:
+        values = keyset.parse_cursor(cursor)
+        if values is None:
+            values = keyset.boundary(query, (number - 1) * per_page)
+        if values is None:
+            return Page([], total, number, keyset, per_page)
+        ordered = ordered.filter(keyset.after(values))
+
+    items = ordered.limit(per_page).all()
+    return Page(items, total, number, keyset, per_page)
@@ -0,0 +1,41 @@
+from contextlib import contextmanager
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+@contextmanager
+def count_queries():
+    """ Records every SQL statement sent to the database inside the block.
+
+        with count_queries() as statements:
+            client.get('/latest')
+        print(len(statements))
+    """
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    # Listening on the class catches the read-only engine as well
+    event.listen(Engine, 'before_cursor_execute', record)
+    try:
+        yield statements
+    finally:
+        event.remove(Engine, 'before_cursor_execute', record)
+
+
+@contextmanager
+def assert_max_queries(limit):
+    """ Fails when the block sends more than `limit` statements, e.g.
+
+        with assert_max_queries(4):
+            client.get('/latest')
+    """
+    with count_queries() as statements:
+        yield statements
+    if len(statements) > limit:
+        raise AssertionError(
+            "{} queries executed, {} allowed:\n{}".format(
+                len(statements), limit, '\n'.join(statements))
+        )
@@ -0,0 +1,110 @@
+import logging
+import os
+import threading
+import time
+
+from flask import current_app
+
+from smash import cache, conf, db
+from smash.models_sqlalchemy import hot_score
+
+logger = logging.getLogger(__name__)
+
+# Well under SQLite's limit on bound parameters
+BATCH = 500
+
+
+def mark(ids):
+    """ Queues quotes for rescoring, inside the current transaction """
+    db.session.execute(
+        'INSERT OR IGNORE INTO "hotDirty" (quoteid) VALUES (:id)',
+        [{'id': id} for id in ids]
+    )
+
+
+def mark_all():
+    db.session.execute('INSERT OR IGNORE INTO "hotDirty" (quoteid) SELECT id FROM quotes')
+
+
+def rescore(cursor, ids):
+    placeholders = ','.join('?' * len(ids))
+    cursor.execute("SELECT id, rating, created FROM quotes "
+                   "WHERE id IN ({})".format(placeholders), ids)
+    cursor.executemany("UPDATE quotes SET hot = ? WHERE id = ?",
+                       [(hot_score(rating, created), id)
+                        for id, rating, created in cursor.fetchall()])
+    cursor.execute('DELETE FROM "hotDirty" WHERE quoteid IN ({})'.format(placeholders), ids)
+
+
+def refresh(batch=BATCH):
+    """ Rescores the quotes voted on since the last run, `batch` at a time.
+    Returns how many were rescored.
+
+    Each batch holds the write lock from reading the queue to clearing it,
+    so a vote landing in between can't be dropped from it.
+    """
+    connection = db.engine.raw_connection()
+    done = 0
+    try:
+        cursor = connection.cursor()
+        while True:
+            cursor.execute("BEGIN IMMEDIATE")
+            try:
+                cursor.execute('SELECT quoteid FROM "hotDirty" LIMIT ?', (batch,))
+                ids = [id for id, in cursor.fetchall()]
+                if ids:
+                    rescore(cursor, ids)
+                connection.commit()
+            except Exception:
+                connection.rollback()
+                raise
+            if not ids:
+                break
+            done += len(ids)
+    finally:
+        connection.close()
+
+    if done:
+        cache.invalidate()
+        db.session.commit()
+    return done
+
+
+class Refresher(object):
+    """ Runs refresh() every `interval` seconds in each worker """
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.thread = None
+        self.pid = None
+        self.app = None
+
+
+    def start(self):
+        # Started lazily so every forked gunicorn worker runs its own
+        if self.pid == os.getpid() and self.thread.is_alive():
+            return
+        with self.lock:
+            if self.pid == os.getpid() and self.thread.is_alive():
+                return
+            self.pid = os.getpid()
+            self.app = current_app._get_current_object()
+            self.thread = threading.Thread(target=self.run, daemon=True)
+            self.thread.start()
+
+
+    def run(self):
+        while True:
+            time.sleep(self.interval)
+            with self.app.app_context():
+                try:
+                    refresh()
+                except Exception:
+                    db.session.rollback()
+                    logger.exception("Hot score refresh failed")
+
+
+refresher = None
+if conf.config.get('HOT_INTERVAL', 60):
+    refresher = Refresher(conf.config.get('HOT_INTERVAL', 60))
@@ -0,0 +1,232 @@
+import fcntl
+import hashlib
+import logging
+import mmap
+import os
+import struct
+import sys
+import tempfile
+import threading
+import time
+from urllib.parse import parse_qs, urlparse
+
+from limits.storage import Storage
+
+logger = logging.getLogger(__name__)
+
+# Slot layout: key hash (0 = free), window expiry (unix time), hit count
+SLOT = struct.Struct('<QdQ')
+# 6 MB, room for a few hundred thousand live windows before keys start
+# being refused
+SLOTS = 1 << 18
+PROBES = 16
+# The slots a key may live in, read with a single unpack
+WINDOW = struct.Struct('<' + 'QdQ' * PROBES)
+GC_INTERVAL = 60
+# What incr() reports for a key with no free slot: over any limit
+REFUSED = sys.maxsize
+# Hits this worker refused for want of a slot, for /metrics
+refused = 0
+
+
+def default_path(database):
+    """ The table for the instance serving `database`, so two instances on
+    a host keep their own counters even when one user runs both.
+    """
+    if database.startswith('sqlite:///'):
+        # Relative to the app's root, as Flask-SQLAlchemy resolves them
+        root = os.path.dirname(os.path.abspath(__file__))
+        database = 'sqlite:///' + os.path.join(root, database[len('sqlite:///'):])
+    digest = hashlib.sha1(database.encode()).hexdigest()[:16]
+    directory = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+    return os.path.join(directory, 'quips-ratelimit-{}-{}'.format(os.getuid(), digest))
+
+
+def storage_url(url, database):
+    """ RATELIMIT_STORAGE_URL, with a bare "shm://" pointed at the table
+    for `database`
+    """
+    parsed = urlparse(url)
+    if parsed.scheme != 'shm' or parsed.path:
+        return url
+    return 'shm://' + default_path(database) + ('?' + parsed.query if parsed.query else '')
+
+
+class SharedMemoryStorage(Storage):
+    """ Fixed-window rate limit counters shared by every worker on a host.
+
+    The counters live in a memory-mapped file (under /dev/shm when there is
+    one) holding a fixed-size hash table. A check is a hash, a POSIX lock
+    and a few struct reads; nothing leaves the machine. A key can sit in
+    any of PROBES slots from its home slot, so expired slots can be reused
+    or wiped at any time without breaking lookups. A background thread in
+    each worker wipes them every GC_INTERVAL seconds.
+
+    A new key whose PROBES slots all hold live windows is refused, as if
+    it were over its limit, rather than evicting somebody else's window.
+
+    Use it with RATELIMIT_STORAGE_URL = "shm://", which create_app() turns
+    into a file named after the database, or "shm:///path/to/file", adding
+    "?slots=N" to size the table. Every worker sharing the file has to use
+    the same size.
+    """
+
+    STORAGE_SCHEME = ["shm"]
+
+    def __init__(self, uri=None, slots=SLOTS, **options):
+        super(SharedMemoryStorage, self).__init__(uri, **options)
+        parsed = urlparse(uri or '')
+        if not parsed.path:
+            raise ValueError("No file for the rate limit table in {!r}".format(uri))
+        self.path = parsed.path
+        self.slots = int(parse_qs(parsed.query).get('slots', [slots])[0])
+        if self.slots < PROBES:
+            raise ValueError("A rate limit table needs at least {} slots".format(PROBES))
+        self.lock = threading.Lock()
+        self.pid = None
+        self.gc_thread = None
+
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        size = self.slots * SLOT.size
+        if os.fstat(fd).st_size < size:
+            os.ftruncate(fd, size)
+        self.fd = fd
+        self.table = mmap.mmap(fd, size)
+
+
+    def locked(self):
+        return _Locked(self)
+
+
+    def home(self, key):
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest()
+        # 0 marks a free slot
+        return int.from_bytes(digest, 'little') or 1
+
+
+    def find(self, key_hash, now):
+        """ (slot of the live entry or None, slot to reuse for a new one) """
+        # Windows never wrap around the end of the table
+        start = key_hash % (self.slots - PROBES + 1)
+        values = WINDOW.unpack_from(self.table, start * SLOT.size)
+        hashes = values[0::3]
+        expiries = values[1::3]
+
+        probe = -1
+        while key_hash in hashes[probe + 1:]:
+            probe = hashes.index(key_hash, probe + 1)
+            if expiries[probe] > now:
+                return start + probe, start + probe
+
+        for probe in range(PROBES):
+            if hashes[probe] == 0 or expiries[probe] <= now:
+                return None, start + probe
+        return None, None
+
+
+    def incr(self, key, expiry, elastic_expiry=False):
+        global refused
+        self.start_gc()
+        key_hash = self.home(key)
+        with self.locked():
+            now = time.time()
+            live, slot = self.find(key_hash, now)
+            if slot is None:
+                refused += 1
+                return REFUSED
+            if live is None:
+                SLOT.pack_into(self.table, slot * SLOT.size, key_hash, now + expiry, 1)
+                return 1
+            _, window, count = SLOT.unpack_from(self.table, slot * SLOT.size)
+            if elastic_expiry:
+                window = now + expiry
+            SLOT.pack_into(self.table, slot * SLOT.size, key_hash, window, count + 1)
+            return count + 1
+
+
+    def get(self, key):
+        key_hash = self.home(key)
+        with self.locked():
+            live, _ = self.find(key_hash, time.time())
+            if live is None:
+                return 0
+            return SLOT.unpack_from(self.table, live * SLOT.size)[2]
+
+
+    def get_expiry(self, key):
+        key_hash = self.home(key)
+        with self.locked():
+            live, _ = self.find(key_hash, time.time())
+            if live is None:
+                return -1
+            return int(SLOT.unpack_from(self.table, live * SLOT.size)[1])
+
+
+    def clear(self, key):
+        key_hash = self.home(key)
+        with self.locked():
+            live, _ = self.find(key_hash, time.time())
+            if live is not None:
+                SLOT.pack_into(self.table, live * SLOT.size, 0, 0, 0)
+
+
+    def check(self):
+        return not self.table.closed
+
+
+    def reset(self):
+        with self.locked():
+            self.table[:] = bytes(len(self.table))
+
+
+    def collect(self, batch=4096):
+        """ Wipes expired windows, holding the lock for one batch at a time """
+        for first in range(0, self.slots, batch):
+            with self.locked():
+                now = time.time()
+                for slot in range(first, min(first + batch, self.slots)):
+                    stored, expiry, _ = SLOT.unpack_from(self.table, slot * SLOT.size)
+                    if stored and expiry <= now:
+                        SLOT.pack_into(self.table, slot * SLOT.size, 0, 0, 0)
+
+
+    def start_gc(self):
+        # Started lazily so every forked worker runs its own collector
+        if self.pid == os.getpid():
+            return
+        with self.lock:
+            if self.pid == os.getpid():
+                return
+            self.pid = os.getpid()
+            self.gc_thread = threading.Thread(target=self.run_gc, daemon=True)
+            self.gc_thread.start()
+
+
+    def run_gc(self):
+        reported = refused
+        while True:
+            time.sleep(GC_INTERVAL)
+            self.collect()
+            if refused > reported:
+                logger.warning("Refused %d rate-limited hits because the table at %s is full; "
+                               "raise its slots (now %d)", refused - reported, self.path, self.slots)
+                reported = refused
+
+
+class _Locked(object):
+    """ Excludes other threads (threading lock) and other worker processes
+    (POSIX record lock on the table file).
+    """
+
+    def __init__(self, storage):
+        self.storage = storage
+
+
+    def __enter__(self):
+        self.storage.lock.acquire()
+        fcntl.lockf(self.storage.fd, fcntl.LOCK_EX)
+
+
+    def __exit__(self, *exc):
+        fcntl.lockf(self.storage.fd, fcntl.LOCK_UN)
+        self.storage.lock.release()
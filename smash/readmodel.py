@@ -0,0 +1,247 @@
+import threading
+from array import array
+from bisect import bisect_left, insort
+
+from sqlalchemy import bindparam, text
+
+from smash import db, pagination, sampling
+
+# More changed quotes than this since the last refresh and it's quicker to
+# read everything again
+RELOAD = 1000
+# Ratings share a key with the id below them, so (rating, id) order is
+# plain integer order
+ID_BITS = 32
+
+
+def top_key(rating, quote_id):
+    return (rating << ID_BITS) | quote_id
+
+
+def changed(ids):
+    """ Records inside the current transaction that the approval, rating or
+    existence of these quotes changed, for every worker's read model to
+    pick up
+    """
+    if ids:
+        db.session.execute(
+            text('INSERT OR REPLACE INTO "quoteChanges" (quoteid, seq) '
+                 'SELECT :quoteid, coalesce(max(seq), 0) + 1 FROM "quoteChanges"'),
+            [{'quoteid': id} for id in ids]
+        )
+
+
+def write_changes(cursor, ids):
+    """ changed() through a DB-API cursor, for bulk loads. The caller holds
+    the write lock, so the sequence is read once and counted on from there.
+    """
+    cursor.execute('SELECT coalesce(max(seq), 0) FROM "quoteChanges"')
+    last = cursor.fetchone()[0]
+    cursor.executemany('INSERT OR REPLACE INTO "quoteChanges" (quoteid, seq) VALUES (?, ?)',
+                       [(id, seq) for seq, id in enumerate(ids, last + 1)])
+
+
+def contains(column, value):
+    i = bisect_left(column, value)
+    return i < len(column) and column[i] == value
+
+
+def discard(column, value):
+    i = bisect_left(column, value)
+    if i < len(column) and column[i] == value:
+        del column[i]
+
+
+class ReadModel(object):
+    """ The order of the approved quotes, kept in this worker's memory so
+    listings never ask SQLite to walk an index: approved ids, ascending,
+    with their ratings beside them, (rating, id) keys for /top, and the
+    approved ids under every tag.
+
+    Every column is an array of machine integers, about 8 bytes a quote
+    each, and each request catches up on the quotes changed since the last
+    one through the quoteChanges sequence.
+    """
+
+    def __init__(self):
+        self.seq = None
+        self.ids = array('q')
+        self.ratings = array('q')
+        self.top = array('q')
+        self.postings = {}
+        self.lock = threading.Lock()
+
+
+    def refresh(self):
+        with self.lock:
+            if self.seq is None:
+                self.load()
+                return
+            found = db.session.execute(
+                text('SELECT quoteid, seq FROM "quoteChanges" WHERE seq > :seq '
+                     'ORDER BY seq LIMIT :limit'),
+                {'seq': self.seq, 'limit': RELOAD + 1}
+            ).fetchall()
+            if len(found) > RELOAD:
+                self.load()
+            elif found:
+                self.apply(sorted(set(id for id, _ in found)))
+                self.seq = found[-1][1]
+
+
+    def load(self):
+        # The DB-API cursor of the session's connection: the same snapshot,
+        # without building a result row object per quote
+        cursor = db.session.connection().connection.cursor()
+        # Read first, so changes made during the load are applied again later
+        cursor.execute('SELECT coalesce(max(seq), 0) FROM "quoteChanges"')
+        seq = cursor.fetchone()[0]
+
+        cursor.execute("SELECT id, rating FROM quotes WHERE approved = 1 ORDER BY id")
+        rows = cursor.fetchall()
+        ids = array('q', [id for id, _ in rows])
+        ratings = array('q', [rating for _, rating in rows])
+
+        # In quote order, which the indexes give for free, so every posting
+        # comes out sorted
+        postings = {}
+        cursor.execute('SELECT l.tagid, l.quoteid FROM "tagsToQuotes" l '
+                       'JOIN quotes q ON q.id = l.quoteid WHERE q.approved = 1 '
+                       'ORDER BY q.id')
+        for tagid, quoteid in cursor.fetchall():
+            posting = postings.get(tagid)
+            if posting is None:
+                posting = postings[tagid] = array('q')
+            posting.append(quoteid)
+
+        self.ids = ids
+        self.ratings = ratings
+        self.top = array('q', sorted(map(top_key, ratings, ids)))
+        self.postings = postings
+        self.seq = seq
+
+
+    def apply(self, ids):
+        """ Brings the columns in line with the database for these quotes """
+        current = dict(db.session.execute(
+            text('SELECT id, rating FROM quotes WHERE approved = 1 AND id IN :ids').
+                bindparams(bindparam('ids', expanding=True)),
+            {'ids': ids}
+        ).fetchall())
+
+        removed = []
+        added = []
+        for id in ids:
+            i = bisect_left(self.ids, id)
+            known = i < len(self.ids) and self.ids[i] == id
+            rating = current.get(id)
+            if known and rating is None:
+                del self.ids[i]
+                discard(self.top, top_key(self.ratings.pop(i), id))
+                removed.append(id)
+            elif known and rating != self.ratings[i]:
+                discard(self.top, top_key(self.ratings[i], id))
+                insort(self.top, top_key(rating, id))
+                self.ratings[i] = rating
+            elif not known and rating is not None:
+                self.ids.insert(i, id)
+                self.ratings.insert(i, rating)
+                insort(self.top, top_key(rating, id))
+                added.append(id)
+
+        if removed:
+            # Their links are gone from the database, so look in every tag
+            for tagid, posting in list(self.postings.items()):
+                for id in removed:
+                    discard(posting, id)
+                if not posting:
+                    del self.postings[tagid]
+        if added:
+            for tagid, quoteid in db.session.execute(
+                    text('SELECT tagid, quoteid FROM "tagsToQuotes" WHERE quoteid IN :ids').
+                        bindparams(bindparam('ids', expanding=True)),
+                    {'ids': added}):
+                posting = self.postings.get(tagid)
+                if posting is None:
+                    posting = self.postings[tagid] = array('q')
+                if not contains(posting, quoteid):
+                    insort(posting, quoteid)
+
+
+    def tagged(self, tag_ids):
+        """ Approved ids carrying every one of the tags, ascending """
+        postings = sorted((self.postings.get(tagid, array('q')) for tagid in tag_ids), key=len)
+        if not postings:
+            return array('q')
+        found = postings[0]
+        if len(postings) > 1:
+            common = set(found).intersection(*postings[1:])
+            found = array('q', sorted(common))
+        return found
+
+
+model = ReadModel()
+
+
+def fetch_page(ids, total, number, per_page):
+    """ The quotes of a page, by primary key """
+    quotes = sampling.fetch(list(ids))
+    return pagination.Page([quotes[id] for id in ids if id in quotes],
+                           total, number, None, per_page)
+
+
+def ordered(column, number, descending=True, per_page=pagination.PER_PAGE):
+    """ One page of a column of the read model, newest or highest first """
+    total = len(column)
+    start = (number - 1) * per_page
+    if descending:
+        page = column[max(0, total - start - per_page):max(0, total - start)][::-1]
+    else:
+        page = column[start:start + per_page]
+    return page, total
+
+
+def latest(number, per_page=pagination.PER_PAGE):
+    model.refresh()
+    with model.lock:
+        ids, total = ordered(model.ids, number, True, per_page)
+    return fetch_page(ids, total, number, per_page)
+
+
+def browse(number, per_page=pagination.PER_PAGE):
+    model.refresh()
+    with model.lock:
+        ids, total = ordered(model.ids, number, False, per_page)
+    return fetch_page(ids, total, number, per_page)
+
+
+def top(number, per_page=pagination.PER_PAGE):
+    model.refresh()
+    with model.lock:
+        keys, total = ordered(model.top, number, True, per_page)
+    mask = (1 << ID_BITS) - 1
+    return fetch_page([key & mask for key in keys], total, number, per_page)
+
+
+def tagged(tag_ids, number, per_page=pagination.PER_PAGE):
+    """ One page of the quotes carrying all the tags, newest first """
+    model.refresh()
+    with model.lock:
+        ids, total = ordered(model.tagged(tag_ids), number, True, per_page)
+    return fetch_page(ids, total, number, per_page)
+
+
+def sample(seed, number, per_page=pagination.PER_PAGE):
+    """ One page of a seeded random walk over the approved quotes, which
+    visits every quote exactly once for a given seed and set of quotes
+    """
+    model.refresh()
+    with model.lock:
+        total = len(model.ids)
+        if not total:
+            return pagination.Page([], 0, number, None, per_page)
+        shuffle = sampling.permutation(seed, total)
+        start = (number - 1) * per_page
+        ids = [model.ids[shuffle(position)]
+               for position in range(start, min(start + per_page, total))]
+    return fetch_page(ids, total, number, per_page)
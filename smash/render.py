@@ -0,0 +1,22 @@
+from functools import lru_cache
+
+from flask import Markup
+
+CACHE_SIZE = 4096
+
+
+def to_html(content):
+    """ Escapes special characters and replaces line breaks with html breaks """
+    return Markup(str(Markup.escape(content)).replace('\n', '</br>'))
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def cached_html(quote_id, content):
+    # lru_cache keys on (id, content), so an edited quote renders afresh
+    return to_html(content)
+
+
+def quote_html(quote):
+    if quote.id is None:
+        return to_html(quote.content)
+    return cached_html(quote.id, quote.content)
@@ -0,0 +1,49 @@
+import random
+
+from smash import db
+from smash.models_sqlalchemy import Quote
+
+# Keeps IN lists under SQLite's bound parameter limit
+CHUNK = 500
+
+
+def new_seed():
+    return random.randrange(1 << 31)
+
+
+def permutation(seed, span):
+    """ A seeded bijection of range(span) onto itself.
+
+    A four round Feistel network shuffles the smallest even-width bit
+    domain covering `span`; values that land outside the range are fed
+    through again (cycle walking), which keeps the mapping a bijection.
+    """
+    rng = random.Random(seed)
+    half = max(1, ((span - 1).bit_length() + 1) // 2)
+    mask = (1 << half) - 1
+    keys = [rng.getrandbits(32) for _ in range(4)]
+
+    def encrypt(value):
+        left, right = value >> half, value & mask
+        for key in keys:
+            mixed = ((right ^ key) * 0x45d9f3b) & 0xffffffff
+            left, right = right, left ^ ((mixed ^ (mixed >> 16)) & mask)
+        return (left << half) | right
+
+    def shuffle(position):
+        value = encrypt(position)
+        while value >= span:
+            value = encrypt(value)
+        return value
+
+    return shuffle
+
+
+def fetch(ids):
+    quotes = {}
+    for i in range(0, len(ids), CHUNK):
+        chunk = ids[i:i + CHUNK]
+        quotes.update((quote.id, quote) for quote in
+                      Quote.query.options(db.selectinload(Quote.tags)).
+                                  filter(Quote.id.in_(chunk), Quote.approved == True))
+    return quotes
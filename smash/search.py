@@ -0,0 +1,90 @@
+import re
+from sqlalchemy import bindparam, text
+
+from smash import db, pagination
+from smash.models_sqlalchemy import Quote
+
+TERM = re.compile(r'"([^"]*)"?|(\S+)')
+
+
+def rebuild():
+    db.session.execute(text("DELETE FROM quotes_fts"))
+    db.session.execute(text(
+        "INSERT INTO quotes_fts (rowid, content) "
+        "SELECT id, content FROM quotes WHERE approved = 1"
+    ))
+
+
+def index(ids):
+    db.session.execute(
+        text("INSERT OR REPLACE INTO quotes_fts (rowid, content) "
+             "SELECT id, content FROM quotes WHERE id IN :ids").
+            bindparams(bindparam('ids', expanding=True)),
+        {'ids': list(ids)}
+    )
+
+
+def remove(ids):
+    db.session.execute(
+        text("DELETE FROM quotes_fts WHERE rowid IN :ids").
+            bindparams(bindparam('ids', expanding=True)),
+        {'ids': list(ids)}
+    )
+
+
+def match_expression(query):
+    """ Turns a user query into an FTS5 MATCH expression.
+
+    Every term is quoted so user input can't inject FTS syntax; "quoted
+    text" is kept as a phrase and a trailing * makes a prefix query.
+    """
+    terms = []
+    for phrase, word in TERM.findall(query):
+        prefix = False
+        if word:
+            prefix = word.endswith('*')
+            phrase = word.rstrip('*')
+        if not phrase.strip():
+            continue
+        term = '"{}"'.format(phrase.replace('"', '""'))
+        if prefix:
+            term += '*'
+        terms.append(term)
+    return ' '.join(terms)
+
+
+def search(query, number, since=None, until=None, per_page=pagination.PER_PAGE):
+    """ One page of approved quotes matching `query`, best bm25 match first,
+    optionally limited to quotes created in [since, until).
+    """
+    expression = match_expression(query)
+    if not expression:
+        return pagination.Page([], 0, number, None, per_page)
+
+    matches = "FROM quotes_fts WHERE quotes_fts MATCH :q"
+    params = {'q': expression, 'since': since, 'until': until}
+    if since is not None or until is not None:
+        matches = ("FROM quotes_fts JOIN quotes ON quotes.id = quotes_fts.rowid "
+                   "WHERE quotes_fts MATCH :q")
+        if since is not None:
+            matches += " AND quotes.created >= :since"
+        if until is not None:
+            matches += " AND quotes.created < :until"
+
+    total = db.session.execute(text("SELECT count(*) " + matches), params).scalar()
+
+    params.update(limit=per_page, offset=(number - 1) * per_page)
+    ids = [row[0] for row in db.session.execute(
+        text("SELECT quotes_fts.rowid " + matches +
+             " ORDER BY rank LIMIT :limit OFFSET :offset"),
+        params
+    )]
+
+    quotes = {}
+    if ids:
+        quotes = {quote.id: quote for quote in
+                  Quote.query.options(db.selectinload(Quote.tags)).
+                              filter(Quote.id.in_(ids), Quote.approved == True)}
+
+    items = [quotes[id] for id in ids if id in quotes]
+    return pagination.Page(items, total, number, None, per_page)
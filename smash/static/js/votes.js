@@ -0,0 +1,24 @@
+// Sends the + and - links of a quote to /upvote and /downvote
+$(document).ready(function() {
+  function vote(url) {
+    return function(event) {
+      var quipnumber = $(event.target).data('postid');
+      $.ajax({
+        url : url,
+        type : "post",
+        contentType: 'application/json;charset=UTF-8',
+        dataType: "json",
+        data : JSON.stringify({'postid' : quipnumber}),
+        success : function(response) {
+          console.log(response);
+        },
+        error : function(xhr) {
+          console.log(xhr);
+        }
+      });
+    };
+  }
+
+  $('a.rate-positive').click(vote('/upvote'));
+  $('a.rate-negative').click(vote('/downvote'));
+});
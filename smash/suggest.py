@@ -0,0 +1,78 @@
+import heapq
+import threading
+import time
+from bisect import bisect_left
+
+from smash import tagcloud
+
+LIMIT = 10
+# Prefixes this short match so many tags that their answers are kept
+MEMO_LENGTH = 2
+# How often a worker asks the database whether the tags changed
+CHECK_INTERVAL = 5.0
+
+
+class PrefixIndex(object):
+    """ Tag names in sorted arrays, so the names starting with a prefix are
+    one contiguous slice found with two binary searches.
+    """
+
+    def __init__(self, tags):
+        tags = sorted((name.lower(), name, count) for name, count in tags)
+        self.keys = [key for key, _, _ in tags]
+        self.names = [name for _, name, _ in tags]
+        self.counts = [count for _, _, count in tags]
+        self.memo = {}
+
+
+    def match(self, prefix, limit=LIMIT):
+        """ The `limit` most used names starting with `prefix`, ignoring case """
+        prefix = prefix.lower()
+        if len(prefix) > MEMO_LENGTH:
+            return self.scan(prefix, limit)
+        key = (prefix, limit)
+        names = self.memo.get(key)
+        if names is None:
+            names = self.scan(prefix, limit)
+            # Only prefixes of existing tags, so requests can't grow it
+            if names:
+                self.memo[key] = names
+        return names
+
+
+    def scan(self, prefix, limit):
+        start = bisect_left(self.keys, prefix)
+        end = bisect_left(self.keys, prefix + '\U0010ffff', start)
+        best = heapq.nsmallest(limit, range(start, end),
+                               key=lambda i: (-self.counts[i], self.keys[i]))
+        return [self.names[i] for i in best]
+
+
+lock = threading.Lock()
+state = {'tags': None, 'index': PrefixIndex([]), 'checked': None}
+
+
+def index():
+    """ This worker's prefix index, rebuilt after the tag cloud changes.
+    The database is asked at most once every CHECK_INTERVAL seconds.
+    """
+    now = time.monotonic()
+    checked = state['checked']
+    if checked is not None and now - checked < CHECK_INTERVAL:
+        return state['index']
+
+    with lock:
+        # Unless another thread checked while this one waited for the lock
+        if state['checked'] is checked:
+            tags = tagcloud.cloud()
+            if tags is not state['tags']:
+                state['index'] = PrefixIndex(tags)
+                state['tags'] = tags
+            state['checked'] = now
+        return state['index']
+
+
+def suggest(prefix, limit=LIMIT):
+    if not prefix:
+        return []
+    return index().match(prefix, limit)
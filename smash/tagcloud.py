@@ -0,0 +1,44 @@
+import threading
+
+from sqlalchemy.sql.expression import func
+
+from smash import counters, db
+from smash.models_sqlalchemy import Quote, Tag, tags_to_quotes
+
+SORTS = {
+    'name': lambda tag: tag[0],
+    'popular': lambda tag: (-tag[1], tag[0]),
+}
+
+lock = threading.Lock()
+cached = {'generation': None, 'tags': {}}
+
+
+def invalidate():
+    """ Marks the tag cloud stale; call in transactions that change which
+    approved quotes a tag has.
+    """
+    counters.incr(counters.TAGS)
+
+
+def load():
+    """ Tag names with their approved quote counts, in one GROUP BY """
+    return db.session.query(Tag.name, func.count(Quote.id)).\
+                      join(tags_to_quotes, tags_to_quotes.c.tagid == Tag.id).\
+                      join(Quote, Quote.id == tags_to_quotes.c.quoteid).\
+                      filter(Quote.approved == True).\
+                      group_by(Tag.id).all()
+
+
+def cloud(sort='name'):
+    """ [(name, count)] for every tag with approved quotes, cached per worker
+    until the next tag write.
+    """
+    generation = counters.get(counters.TAGS)
+    with lock:
+        if cached['generation'] != generation:
+            tags = load()
+            cached['tags'] = {key: sorted(tags, key=order)
+                              for key, order in SORTS.items()}
+            cached['generation'] = generation
+        return cached['tags'][sort]
@@ -1,17 +1,15 @@
 import datetime
 import json
 import logging
-import sqlite3
-from collections import defaultdict
-from sqlalchemy.sql.expression import func, select
-from flask import render_template, Markup, request, redirect, abort, session, g
+from urllib.parse import urlencode
+from flask import render_template, request, redirect, abort, session, g, Blueprint, Response, current_app, stream_with_context
 
 from smash.models_sqlalchemy import *
-from smash import app, conf, db, limiter, xcaptcha
+from smash import conf, db, limiter, archive, cache, counters, dedup, export, ingest, moderation, pagination, readmodel, sampling, search, suggest, tagcloud, votes
 
 logger = logging.getLogger(__name__)
 
-TIME_FORMAT="%H:%M:%S %m/%d/%Y"
+bp = Blueprint('quips', __name__)
 
 
 def timestamp():
@@ -32,13 +30,14 @@ def message(level, msg):
     )
 
 
-@app.before_request
+@bp.before_app_request
 def before_request():
     g.appname = conf.config['APPNAME']
     g.appbrand = conf.config['APPBRAND']
 
 
-@app.route('/')
+@bp.route('/')
+@cache.cached
 def index():
     welcome = conf.config['MOTD']
     news = ("<p><b>{}</b></p><h4>{} running on quips database"
@@ -55,7 +54,7 @@ def index():
     )
 
 
-@app.route('/login', methods=['GET', 'POST'])
+@bp.route('/login', methods=['GET', 'POST'])
 def login_page():
     if request.method == 'POST':
         if request.form["secret"] == conf.config['ADMINSECRET']:
@@ -67,214 +66,228 @@ def login_page():
     )
 
 
-@app.route('/latest')
-def latest():
-    quotes = Quote.query.filter_by(approved=True).order_by(Quote.id.desc()).all()
-    allquotes = len(quotes)
-    quotes = quotes[:10]
+HOT = pagination.Keyset(Quote.hot, Quote.id)
+BROWSE = pagination.Keyset(Quote.id, descending=False)
+ARCHIVE = pagination.Keyset(Quote.created, Quote.id)
+QUEUE_PER_PAGE = 50
 
-    if len(quotes)>0:
-        # Replace line breaks with html breaks and escape special characters
-        for quote in quotes:
-            quote.content = str(Markup.escape(quote.content)).replace('\n', '</br>')
 
-        return render_template(
-            "latest.html",
-            title="Latest",
-            quotes=quotes,
-            numpages=1 + allquotes//10,
-            curpage=0,
-            page_type="latest"
-        )
-    else:
-        return message("alert-warning", "No quips in the database.")
+def time_range():
+    """ The ?from=YYYY-MM-DD&to=YYYY-MM-DD bounds of a request as unix times """
+    try:
+        return archive.date_range(request.args.get('from'), request.args.get('to'))
+    except ValueError:
+        abort(400)
 
 
-@app.route('/latest/<int:page>')
-def latest_page(page):
-    allquotes = len(Quote.query.filter_by(approved=True).order_by(Quote.id.desc()).all())
-    quotes = Quote.query.filter_by(approved=True).order_by(Quote.id.desc()).all()[(page-1)*10:page*10]
+def listing(template, query, keyset, page, title, page_type, empty, total=None, **context):
+    if page < 1:
+        abort(404)
 
-    for quote in quotes:
-        quote.content = str(Markup.escape(quote.content)).replace('\n', '</br>')
+    result = pagination.paginate(
+        query,
+        keyset,
+        page,
+        request.args.get('after'),
+        total
+    )
+    return render_page(template, result, title, page_type, empty, **context)
+
+
+def render_page(template, result, title, page_type, empty, **context):
+    page = result.number
+    if page == 1 and not result.items:
+        return message("alert-warning", empty)
+
+    if page > 1:
+        title = "{} - page {}".format(title, page)
 
     return render_template(
-        "latest.html",
-        title="Latest - page {}".format(page),
-        quotes=quotes,
-        numpages=1 + allquotes//10,
+        template,
+        title=title,
+        quotes=result.items,
+        numpages=result.numpages,
         curpage=page-1,
-        page_type="latest"
+        cursor=result.next_cursor,
+        page_type=page_type,
+        **context
     )
 
 
-@app.route('/top')
-def top():
-    quotes = Quote.query.filter_by(approved=True).order_by(Quote.rating.desc()).all()
-    allquotes = len(quotes)
-    quotes = quotes[:10]
-
-    if len(quotes)>0:
-        # Replace line breaks with html breaks and escape special characters
-        for quote in quotes:
-            quote.content = str(Markup.escape(quote.content)).replace('\n', '</br>')
-
-        return render_template(
-            "latest.html",
-            title="Top",
-            quotes=quotes,
-            numpages=1 + allquotes//10,
-            curpage=0,
-            page_type="top"
-        )
-    else:
-        return message("alert-warning", "No quips in the database.")
+@bp.route('/latest')
+@bp.route('/latest/<int:page>')
+@cache.cached
+def latest(page=1):
+    if page < 1:
+        abort(404)
 
+    return render_page(
+        "latest.html",
+        readmodel.latest(page),
+        "Latest",
+        "latest",
+        "No quips in the database."
+    )
 
-@app.route('/top/<int:page>')
-def top_page(page):
-    allquotes = len(Quote.query.filter_by(approved=True).order_by(Quote.rating.desc()).all())
-    quotes = Quote.query.filter_by(approved=True).order_by(Quote.rating.desc()).all()[(page-1)*10:page*10]
 
-    for quote in quotes:
-        quote.content = str(Markup.escape(quote.content)).replace('\n', '</br>')
+@bp.route('/top')
+@bp.route('/top/<int:page>')
+@cache.cached
+def top(page=1):
+    if page < 1:
+        abort(404)
 
-    return render_template(
+    return render_page(
         "latest.html",
-        title="Top - page {}".format(page),
-        quotes=quotes,
-        numpages=1 + allquotes//10,
-        curpage=page-1,
-        page_type="top"
+        readmodel.top(page),
+        "Top",
+        "top",
+        "No quips in the database."
     )
 
-@app.route('/browse')
-def browse():
-    quotes = Quote.query.filter_by(approved=True).order_by(Quote.id.asc()).all()
-    allquotes = len(quotes)
-    quotes = quotes[:10]
 
-    if len(quotes)>0:
-        # Replace line breaks with html breaks and escape special characters
-        for quote in quotes:
-            quote.content = str(Markup.escape(quote.content)).replace('\n', '</br>')
+@bp.route('/hot')
+@bp.route('/hot/<int:page>')
+@cache.cached
+def hot(page=1):
+    return listing(
+        "latest.html",
+        Quote.query.options(db.selectinload(Quote.tags)).filter_by(approved=True),
+        HOT,
+        page,
+        "Hot",
+        "hot",
+        "No quips in the database.",
+        counters.get(counters.APPROVED)
+    )
 
-        return render_template(
-            "latest.html",
-            title="Latest",
-            quotes=quotes,
-            numpages=1 + allquotes//10,
-            curpage=0,
-            page_type="browse"
-        )
-    else:
-        return message("alert-warning", "No quips in the database.")
 
-@app.route('/browse/<int:page>')
-def browse_page(page):
-    allquotes = len(Quote.query.filter_by(approved=True).order_by(Quote.id.asc()).all())
-    quotes = Quote.query.filter_by(approved=True).order_by(Quote.id.asc()).all()[(page-1)*10:page*10]
+@bp.route('/browse')
+@bp.route('/browse/<int:page>')
+@cache.cached
+def browse(page=1):
+    if page < 1:
+        abort(404)
 
-    for quote in quotes:
-        quote.content = str(Markup.escape(quote.content)).replace('\n', '</br>')
+    return render_page(
+        "latest.html",
+        readmodel.browse(page),
+        "Browse",
+        "browse",
+        "No quips in the database."
+    )
 
+@bp.route('/archive')
+@cache.cached
+def archive_index():
     return render_template(
-        "latest.html",
-        title="Latest - page {}".format(page),
-        quotes=quotes,
-        numpages=1 + allquotes//10,
-        curpage=page-1,
-        page_type="browse"
+        "archive.html",
+        title="Archive",
+        months=archive.months()
     )
 
-@app.route('/random')
-def random():
-    quotes = Quote.query.filter_by(approved=True).order_by(func.random()).all()
-    allquotes = len(quotes)
-    quotes = quotes[:10]
 
-    if len(quotes)>0:
-        # Replace line breaks with html breaks and escape special characters
-        for quote in quotes:
-            quote.content = str(Markup.escape(quote.content)).replace('\n', '</br>')
+@bp.route('/archive/<int:year>/<int:month>')
+@bp.route('/archive/<int:year>/<int:month>/<int:page>')
+@cache.cached
+def archive_month(year, month, page=1):
+    try:
+        start, end = archive.month_range(year, month)
+    except (ValueError, OverflowError):
+        abort(404)
 
-        return render_template(
-            "latest.html",
-            title="Random",
-            quotes=quotes,
-            numpages=1 + allquotes//10,
-            curpage=0,
-            page_type="random"
-        )
-    else:
-        return message("alert-warning", "No quips in the database.")
+    quotes = Quote.query.options(db.selectinload(Quote.tags)).filter_by(approved=True)
 
-@app.route('/random/<int:page>')
-def random_page(page):
-    allquotes = len(Quote.query.filter_by(approved=True).order_by(func.random()).all())
-    quotes = Quote.query.filter_by(approved=True).order_by(func.random()).all()[(page-1)*10:page*10]
+    return listing(
+        "latest.html",
+        archive.within(quotes, start, end),
+        ARCHIVE,
+        page,
+        "Archive - {}/{:02d}".format(year, month),
+        "archive/{}/{}".format(year, month),
+        "No quips from this month."
+    )
 
-    for quote in quotes:
-        quote.content = str(Markup.escape(quote.content)).replace('\n', '</br>')
 
-    return render_template(
+@bp.route('/random')
+@bp.route('/random/<int:page>')
+def random(page=1):
+    if page < 1:
+        abort(404)
+
+    seed = request.args.get('seed', type=int)
+    if seed is None:
+        seed = sampling.new_seed()
+        if page > 1:
+            return redirect("/random/{}?seed={}".format(page, seed))
+
+    return render_page(
         "latest.html",
-        title="Latest - page {}".format(page),
-        quotes=quotes,
-        numpages=1 + allquotes//10,
-        curpage=page-1,
-        page_type="random"
+        readmodel.sample(seed, page),
+        "Random",
+        "random",
+        "No quips in the database.",
+        seed=seed
     )
 
 
-@app.route('/queue')
-def queue():
+@bp.route('/queue')
+@bp.route('/queue/<int:page>')
+def queue(page=1):
     if not session.get('authorized'):
         return message("alert-danger", "You are not authorized to view this page.")
 
-    quotes = Quote.query.filter_by(approved=False).order_by(Quote.id).all()
-
-    if len(quotes)>0:
-        # Replace line breaks with html breaks and escape special characters
-        for quote in quotes:
-            quote.content = str(Markup.escape(quote.content)).replace('\n', '</br>')
+    if page < 1:
+        abort(404)
 
-        return render_template(
-            "queue.html",
-            title="Queue",
-            quotes=quotes
-        )
-    else:
-        return message("alert-warning", "No quotes in the database.")
+    result = pagination.paginate(
+        Quote.query.options(db.selectinload(Quote.tags)).filter_by(approved=False),
+        BROWSE,
+        page,
+        request.args.get('after'),
+        counters.get(counters.PENDING),
+        QUEUE_PER_PAGE
+    )
+    return render_page(
+        "queue.html",
+        result,
+        "Queue",
+        "queue",
+        "No quotes in the database.",
+        duplicates=dedup.duplicates([quote.id for quote in result.items])
+    )
 
 
-@app.route('/moderate', methods=['POST'])
+@bp.route('/moderate', methods=['POST'])
 def moderate():
     if not session.get('authorized'):
         return message("alert-danger", "You are not authorized to perform this action.")
 
-    if request.form['submit'] == "Approve":
-        quote = Quote.query.filter_by(id=request.form['quoteid']).first()
-        quote.approved = True
-        db.session.commit()
+    ids = request.form.getlist('quoteid', type=int)
+    if not ids:
+        return message("alert-warning", "No such quip.")
 
-        return message("alert-success", "Quip approved.")
+    if request.form['submit'] == "Approve":
+        approved = moderation.approve(ids)
+        if approved == 0:
+            return message("alert-warning", "No such quip.")
+        if approved == 1:
+            return message("alert-success", "Quip approved.")
+        return message("alert-success", "{} quips approved.".format(approved))
 
     elif request.form['submit'] == "Delete":
-        quote = Quote.query.filter_by(id=request.form['quoteid']).first()
-        # Delete dangling tags (alive only with current Quote)
-        dangling_tags = [tag for tag in quote.tags if tag.quotes.count() == 1]
-        for tag in dangling_tags:
-            db.session.delete(tag)
-        db.session.delete(quote)
-        db.session.commit()
-
-        return message("alert-success", "Quip deleted.")
+        deleted = moderation.delete(ids)
+        if deleted == 0:
+            return message("alert-warning", "No such quip.")
+        if deleted == 1:
+            return message("alert-success", "Quip deleted.")
+        return message("alert-success", "{} quips deleted.".format(deleted))
 
     abort(501)
 
 
-@app.route('/quip/<int:id>')
+@bp.route('/quip/<int:id>')
+@cache.cached
 def quote(id):
     quote = Quote.query.filter_by(id=id, approved=True).first()
 
@@ -285,7 +298,6 @@ def quote(id):
             message="No such quip."
         )
     else:
-        quote.content = str(Markup.escape(quote.content)).replace('\n', '</br>')
         return render_template(
             "latest.html",
             title="Quip #{}".format(quote.id),
@@ -296,144 +308,103 @@ def quote(id):
         )
 
 
-@app.route('/tag/<tagname>')
-def tag(tagname):
-    tag = Tag.query.filter_by(name=tagname).first()
-
-    if tag is not None:
-        if len(list(tag.quotes))>0:
-            allquotes = len(list(tag.quotes))
-            tag.quotes = tag.quotes[:10]
+@bp.route('/tag/<tagname>')
+@bp.route('/tag/<tagname>/<int:page>')
+@cache.cached
+def tag(tagname, page=1):
+    """ Quotes with a tag, or with all of several: /tag/a+b """
+    if page < 1:
+        abort(404)
 
-            # Replace line breaks with html breaks and escape special characters
-            for quote in tag.quotes:
-                quote.content = str(Markup.escape(quote.content)).replace('\n', '</br>')
-
-            return render_template(
-                "latest.html",
-                title="Tag - {}".format(tagname),
-                quotes=tag.quotes,
-                numpages=1 + allquotes//10,
-                curpage=0,
-                page_type="tag/{}".format(tagname)
-            )
+    # A tag may have a + in its name, like c++
+    names = set([tagname] + tagname.split('+'))
+    found = dict(db.session.query(Tag.name, Tag.id).filter(Tag.name.in_(names)))
+    if tagname in found:
+        tag_ids = [found[tagname]]
     else:
+        tag_ids = [found.get(name) for name in set(tagname.split('+'))]
+    if None in tag_ids:
         return message("alert-warning", "No quotes with this tag.")
 
-
-@app.route('/tag/<tagname>/<int:page>')
-def tag_page(tagname, page):
-    tag = Tag.query.filter_by(name=tagname).first()
-
-    if len(list(tag.quotes))>0:
-        allquotes = len(list(tag.quotes))
-        tag.quotes = tag.quotes[(page-1)*10:page*10]
-
-        for quote in tag.quotes:
-            quote.content = str(Markup.escape(quote.content)).replace('\n', '</br>')
-
-        return render_template(
-            "latest.html",
-            title="Tag - {} - page {}".format(tagname, page),
-            quotes=tag.quotes,
-            numpages=1 + allquotes//10,
-            curpage=0,
-            page_type="tag/{}".format(tagname)
-        )
+    return render_page(
+        "latest.html",
+        readmodel.tagged(tag_ids, page),
+        "Tag - {}".format(tagname),
+        "tag/{}".format(tagname),
+        "No quotes with this tag."
+    )
 
 
-@app.route('/tags')
+@bp.route('/tags')
 def tags():
-    tags = Tag.query.order_by(Tag.name).distinct().all()
-    tags = list(set([x.name for x in tags]))
+    sort = request.args.get('sort', 'name')
+    if sort not in tagcloud.SORTS:
+        abort(400)
 
     return render_template(
         "tags.html",
         title="Tags",
-        tags=tags
+        tags=tagcloud.cloud(sort),
+        sort=sort
     )
 
 
-@app.route('/search/<query>')
-def search(query):
-    quotes = Quote.query.filter_by(approved=True).filter(Quote.content.ilike('%{}%'.format(query))).order_by(Quote.id.desc()).all()
+@bp.route('/tags/suggest')
+@limiter.exempt
+def suggest_tags():
+    """ Existing tags starting with ?q=, most used first, for autocomplete """
+    names = suggest.suggest(request.args.get('q', '').strip())
+    response = Response(json.dumps(names), mimetype='application/json')
+    response.cache_control.public = True
+    response.cache_control.max_age = int(suggest.CHECK_INTERVAL)
+    return response
 
-    allquotes = len(quotes)
-    quotes = quotes[:10]
 
-    if len(quotes)>0:
-        # Replace line breaks with html breaks and escape special characters
-        for quote in quotes:
-            quote.content = str(Markup.escape(quote.content)).replace('\n', '</br>')
+@bp.route('/search/<query>')
+@bp.route('/search/<query>/<int:page>')
+def search_quotes(query, page=1):
+    if page < 1:
+        abort(404)
 
-        return render_template(
-            "search.html",
-            title="Search for: {}".format(query),
-            quotes=quotes,
-            numpages=1 + allquotes//10,
-            curpage=0,
-            page_type="search",
-            search_query=query
-        )
-    else:
-        return message("alert-warning", "No quotes in the database.")
-
-
-@app.route('/search/<query>/<int:page>')
-def search_page(query, page):
-    allquotes = len(Quote.query.filter_by(approved=True).\
-                                filter(Quote.content.ilike('%{}%'.format(query))).\
-                                order_by(Quote.id.desc()).all())
-    quotes = Quote.query.filter_by(approved=True).\
-                         filter(Quote.content.ilike('%{}%'.format(query))).\
-                         order_by(Quote.id.desc()).all()[(page-1)*10:page*10]
+    since, until = time_range()
+    bounds = {key: request.args[key] for key in ('from', 'to') if request.args.get(key)}
 
-    for quote in quotes:
-        quote.content = str(Markup.escape(quote.content)).replace('\n', '</br>')
-
-    return render_template(
+    return render_page(
         "search.html",
-        title="Search for: {} - page {}".format(query, page),
-        quotes=quotes,
-        numpages=1 + allquotes//10,
-        curpage=page-1,
-        page_type="search",
-        search_query=query
+        search.search(query, page, since, until),
+        "Search for: {}".format(query),
+        "search",
+        "No quotes in the database.",
+        search_query=query,
+        range_query=urlencode(bounds)
     )
 
-@app.route('/slack', methods=['POST'])
+@bp.route('/slack', methods=['POST'])
 @limiter.limit("5 per minute;25 per day")
 def slack():
     quote_body = request.form["text"]
-    quote = Quote(quote_body, request.remote_addr, timestamp())
-    db.session.add(quote)
-    db.session.commit()
+    if not ingest.submit(quote_body, request.remote_addr, timestamp()):
+        return json.dumps({'status' : 'duplicate'})
 
     return json.dumps({'status' : 'success'})
 
 
-@app.route('/add', methods=['GET', 'POST'])
+@bp.route('/add', methods=['GET', 'POST'])
 @limiter.limit("5 per minute;25 per day")
 def add_new():
     if request.method == 'POST':
-        if xcaptcha.verify():
+        if current_app.extensions['xcaptcha'].verify():
             if request.form['submit'] == "Submit":
                 quote_body = request.form["newquote"]
                 quote_tags = request.form["tags"].split(',')
 
-                quote = Quote(quote_body, request.remote_addr, timestamp())
-                quote_tags = [Tag(tag) for tag in quote_tags]
-
-                for tag in quote_tags:
-                    dbtag = Tag.query.filter_by(name=tag.name).first()
-                    if dbtag is not None:
-                        quote.tags.append(dbtag)
-                    else:
-                        quote.tags.append(tag)
-                #quote.tags.extend(quote_tags)
-
-                db.session.add(quote)
-                db.session.commit()
+                if not ingest.submit(quote_body, request.remote_addr, timestamp(), quote_tags):
+                    return render_template(
+                        "add.html",
+                        alertclass="alert-warning",
+                        message="This quote is already in the database.",
+                        title="Add new"
+                    )
 
                 return render_template(
                     "message.html",
@@ -471,64 +442,57 @@ def add_new():
             title="Add new"
         )
 
-@app.route('/upvote', methods=['POST'])
+def vote(delta):
+    data_received = json.loads(request.data)
+
+    try:
+        quote_id = int(data_received['postid'])
+    except (KeyError, TypeError, ValueError):
+        return json.dumps({'status' : 'no post found'})
+
+    if votes.vote(quote_id, delta):
+        return json.dumps({'status' : 'success'})
+    return json.dumps({'status' : 'no post found'})
+
+
+@bp.route('/upvote', methods=['POST'])
 @limiter.limit("5 per minute")
 def upvote_post():
-    if request.method == "POST":
-
-        data_received = json.loads(request.data) 
-        
-        quip = Quote.query.filter_by(id=data_received['postid']).first()
-        
-        if quip:
-            setattr(quip, "rating", quip.rating + 1)
-            db.session.commit()
-                 
-            return json.dumps({'status' : 'success'})
-        return json.dumps({'status' : 'no post found'})
-    return redirect(url_for('index'))
+    return vote(1)
+
 
-@app.route('/downvote', methods=['POST'])
+@bp.route('/downvote', methods=['POST'])
 @limiter.limit("1 per minute")
 def downvote_post():
-    if request.method == "POST":
-
-        data_received = json.loads(request.data) 
-        
-        quip = Quote.query.filter_by(id=data_received['postid']).first()
-        
-        if quip:
-            setattr(quip, "rating", quip.rating - 1)
-            db.session.commit()
-                 
-            return json.dumps({'status' : 'success'})
-        return json.dumps({'status' : 'no post found'})
-    return redirect(url_for('index'))
+    return vote(-1)
 
-@app.route('/export', methods=['GET'])
+
+@bp.route('/export', methods=['GET'])
 @limiter.limit("5 per minute")
 def export_get():
-    """exfiltrates all approved quotes from the database from an unauthenticated endpoint."""
-    all_tag_names = Tag.query.all()
-    tag_names = {}
-    for tag in all_tag_names:
-        tag_names[tag.id] = tag.name
-
-    all_tags = db.session.query(tags_to_quotes).all()
-    tag_map = defaultdict(list)
-    for tag in all_tags:
-        tag_map[tag.quoteid].append(tag_names[tag.tagid])
-
-    result = []
-    all_quotes = Quote.query.filter_by(approved=True).order_by(Quote.id.desc()).all()
-
-    for q in all_quotes:
-        result.append({
-            'content': q.content,
-            'rating': q.rating,
-            'authorIP': q.author_ip,
-            'time': q.time,
-            'tags': tag_map[q.id],
-        })
-    return json.dumps(result), 200, {'Content-Type': 'application/json'}
-    
+    """exfiltrates all approved quotes from the database from an unauthenticated endpoint.
+
+    Streams `format=json` (default), `ndjson` or `csv`, newest first or
+    oldest first with `order=asc`, gzipped on the fly for clients that
+    accept it. `from` and `to` (YYYY-MM-DD) limit it to a date range.
+    """
+    fmt = request.args.get('format', 'json')
+    if fmt not in export.FORMATS:
+        abort(400)
+    since, until = time_range()
+
+    compress = 'gzip' in request.accept_encodings
+    response = Response(
+        stream_with_context(export.stream(
+            fmt,
+            compress,
+            request.args.get('order') == 'asc',
+            since,
+            until
+        )),
+        mimetype=export.MIMETYPES[fmt]
+    )
+    if compress:
+        response.headers['Content-Encoding'] = 'gzip'
+    response.vary.add('Accept-Encoding')
+    return response
@@ -0,0 +1,118 @@
+import atexit
+import logging
+import os
+import threading
+import time
+from collections import Counter
+
+from flask import current_app
+
+from smash import cache, conf, db, ranking, readmodel
+from smash.models_sqlalchemy import Quote
+
+logger = logging.getLogger(__name__)
+
+
+def apply(deltas):
+    """ Adds rating deltas ({quote id: delta}) in one transaction.
+
+    The increments run in SQL, so concurrent workers can't lose votes to a
+    read-modify-write race. Returns the number of quotes updated.
+    """
+    quotes = Quote.__table__
+    updated = []
+    for quote_id, delta in deltas.items():
+        if delta and db.session.execute(
+                quotes.update().
+                       where(quotes.c.id == quote_id).
+                       values(rating=quotes.c.rating + delta)
+            ).rowcount:
+            updated.append(quote_id)
+    if updated:
+        # Their /hot scores catch up in the next ranking.refresh()
+        ranking.mark(updated)
+        readmodel.changed(updated)
+        cache.invalidate()
+    db.session.commit()
+    return len(updated)
+
+
+class VoteBuffer(object):
+    """ Collects votes in process and writes them in one transaction every
+    `interval` seconds or `size` votes, whichever comes first.
+    """
+
+    def __init__(self, interval, size):
+        self.interval = interval
+        self.size = size
+        self.deltas = Counter()
+        self.votes = 0
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.thread = None
+        self.pid = None
+        self.app = None
+
+
+    def add(self, quote_id, delta):
+        self.start()
+        with self.lock:
+            self.deltas[quote_id] += delta
+            self.votes += 1
+            full = self.votes >= self.size
+        if full:
+            self.flush()
+
+
+    def flush(self):
+        with self.flush_lock:
+            with self.lock:
+                deltas, self.deltas = self.deltas, Counter()
+                self.votes = 0
+            if not deltas:
+                return
+            with self.app.app_context():
+                try:
+                    apply(deltas)
+                except Exception:
+                    db.session.rollback()
+                    logger.exception("Dropped %d buffered votes", sum(map(abs, deltas.values())))
+
+
+    def start(self):
+        # Started lazily so every forked gunicorn worker runs its own flusher
+        if self.pid == os.getpid() and self.thread.is_alive():
+            return
+        with self.lock:
+            if self.pid == os.getpid() and self.thread.is_alive():
+                return
+            self.pid = os.getpid()
+            self.app = current_app._get_current_object()
+            self.thread = threading.Thread(target=self.run, daemon=True)
+            self.thread.start()
+
+
+    def run(self):
+        while True:
+            time.sleep(self.interval)
+            self.flush()
+
+
+buffer = None
+if conf.config.get('VOTE_BUFFER_MS'):
+    buffer = VoteBuffer(conf.config['VOTE_BUFFER_MS'] / 1000.0,
+                        conf.config.get('VOTE_BUFFER_SIZE', 100))
+    atexit.register(buffer.flush)
+
+
+def vote(quote_id, delta):
+    """ Records a vote, returns False if there's no such quote """
+    if ranking.refresher is not None:
+        ranking.refresher.start()
+    if buffer is None:
+        return apply({quote_id: delta}) > 0
+
+    if db.session.query(Quote.id).filter_by(id=quote_id).first() is None:
+        return False
+    buffer.add(quote_id, delta)
+    return True
@@ -0,0 +1,86 @@
+import json
+import os
+import tempfile
+
+import pytest
+
+# smash reads config.json from the working directory on import
+WORKDIR = tempfile.mkdtemp(prefix='quips-tests-')
+with open(os.path.join(WORKDIR, 'config.json'), 'w') as f:
+    json.dump({
+        'APPNAME': 'Quips tests',
+        'APPBRAND': 'Quips tests',
+        'MOTD': 'Testing',
+        'SECRETKEY': 'test',
+        'ADMINSECRET': 'test',
+        'DATABASE_URL': 'sqlite:///' + os.path.join(WORKDIR, 'unused.db'),
+        'RATELIMIT_STORAGE_URL': 'memory://',
+        'VOTE_BUFFER_MS': 0,
+        'HOT_INTERVAL': 0,
+    }, f)
+os.chdir(WORKDIR)
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    """ An app on its own empty SQLite database, inside an app context """
+    from smash import cache, create_app, db, limiter, readmodel, suggest, tagcloud
+    from smash.commands import setup_database
+
+    # Worker-wide state would otherwise carry over from the last test's database
+    monkeypatch.setattr(cache, 'pages', cache.PageCache())
+    monkeypatch.setattr(readmodel, 'model', readmodel.ReadModel())
+    monkeypatch.setattr(tagcloud, 'cached', {'generation': None, 'tags': {}})
+    monkeypatch.setattr(suggest, 'state',
+                        {'tags': None, 'index': suggest.PrefixIndex([]), 'checked': None})
+
+    app = create_app()
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + str(tmp_path / 'quips.db')
+    app.config['TESTING'] = True
+    monkeypatch.setattr(limiter, 'enabled', False)
+    app.extensions['xcaptcha'].is_enabled = False
+
+    with app.app_context():
+        setup_database()
+        yield app
+        db.session.remove()
+        db.get_engine(app).dispose()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def moderator(app):
+    client = app.test_client()
+    client.post('/login', data={'secret': 'test'})
+    return client
+
+
+@pytest.fixture
+def add_quotes(app):
+    """ Stores approved quotes, returns their ids """
+    from smash import counters, db, readmodel, search
+    from smash.models_sqlalchemy import Quote, Tag
+
+    def add(count, tags=(), approved=True, content="<nick> quote number {}"):
+        tag_objects = [Tag.query.filter_by(name=name).first() or Tag(name) for name in tags]
+        quotes = []
+        for i in range(count):
+            quote = Quote(content.format(i), '127.0.0.1', '12:00:00 01/01/2021')
+            quote.approved = approved
+            quote.tags.extend(tag_objects)
+            db.session.add(quote)
+            quotes.append(quote)
+        db.session.flush()
+        ids = [quote.id for quote in quotes]
+        readmodel.changed(ids)
+        db.session.commit()
+        counters.rebuild()
+        search.rebuild()
+        db.session.commit()
+        return ids
+
+    return add
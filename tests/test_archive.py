@@ -0,0 +1,71 @@
+from smash import archive, db, search
+from smash.models_sqlalchemy import Quote
+
+
+def add_dated(*times):
+    """ Stores an approved quote per time string, returns their ids """
+    quotes = []
+    for i, when in enumerate(times):
+        quote = Quote("<nick> dated quote {}".format(i), '127.0.0.1', when)
+        quote.approved = True
+        db.session.add(quote)
+        quotes.append(quote)
+    db.session.commit()
+    search.rebuild()
+    db.session.commit()
+    return [quote.id for quote in quotes]
+
+
+def test_month_range_wraps_the_year():
+    start, end = archive.month_range(2020, 12)
+    assert end == archive.month_range(2021, 1)[0]
+    assert end - start == 31 * 24 * 3600
+
+
+def test_date_range_includes_both_days():
+    start, end = archive.date_range('2021-01-01', '2021-01-01')
+    assert end - start == 24 * 3600
+    assert archive.date_range() == (None, None)
+
+
+def test_index_lists_months(client):
+    add_dated('12:00:00 01/05/2021', '12:00:00 01/20/2021', '12:00:00 03/01/2021')
+    assert archive.months() == [(2021, 3, 1), (2021, 1, 2)]
+    body = client.get('/archive').get_data(as_text=True)
+    assert '/archive/2021/1"' in body
+    assert '/archive/2021/3"' in body
+
+
+def test_month_pages_follow_the_cursor(client):
+    add_dated(*['12:00:00 02/{:02d}/2021'.format(day) for day in range(1, 16)])
+    add_dated('12:00:00 03/01/2021')
+
+    first = client.get('/archive/2021/2').get_data(as_text=True)
+    second = client.get('/archive/2021/2/2').get_data(as_text=True)
+    assert 'dated quote 14</p>' in first
+    assert 'dated quote 5</p>' in first
+    assert 'dated quote 4</p>' not in first
+    assert 'dated quote 4</p>' in second
+    assert 'dated quote 0</p>' in second
+    assert 'dated quote 5</p>' not in second
+    assert 'dated quote 0</p>' not in first
+
+
+def test_bad_months_are_not_found(client):
+    assert client.get('/archive/2021/13').status_code == 404
+
+
+def test_search_by_date(client):
+    add_dated('12:00:00 01/05/2021', '12:00:00 02/05/2021')
+    body = client.get('/search/dated?from=2021-02-01&to=2021-02-28').get_data(as_text=True)
+    assert 'dated quote 1</p>' in body
+    assert 'dated quote 0</p>' not in body
+    assert client.get('/search/dated?from=2021-02-31').status_code == 400
+
+
+def test_export_by_date(client):
+    add_dated('12:00:00 01/05/2021', '12:00:00 02/05/2021')
+    body = client.get('/export?format=ndjson&from=2021-01-01&to=2021-01-31').get_data(as_text=True)
+    assert 'dated quote 0' in body
+    assert 'dated quote 1' not in body
+    assert client.get('/export?to=yesterday').status_code == 400
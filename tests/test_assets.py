@@ -0,0 +1,64 @@
+import gzip
+import os
+
+import pytest
+
+from smash import assets
+
+CSS = b"body { background: url('../img/bg.png'); } @font-face { src: url(../fonts/f.woff?v=1#x); }"
+
+
+@pytest.fixture
+def built(tmp_path):
+    static = tmp_path / 'static'
+    for path, data in [('css/custom.css', CSS), ('img/bg.png', b'png'),
+                       ('fonts/f.woff', b'woff'), ('js/app.js', b'var x = 1;\n' * 100),
+                       ('css/custom.css.map', b'{}')]:
+        os.makedirs(str((static / path).parent), exist_ok=True)
+        (static / path).write_bytes(data)
+    out = tmp_path / 'dist'
+    return out, assets.build(str(static), str(out))
+
+
+def test_build_fingerprints_and_compresses(built):
+    out, manifest = built
+    files = manifest['files']
+    assert sorted(files) == ['css/custom.css', 'fonts/f.woff', 'img/bg.png', 'js/app.js']
+    assert files['img/bg.png'] == assets.fingerprint('img/bg.png', b'png')
+    assert manifest['gzip'] == [files['js/app.js']]
+    assert gzip.decompress((out / (files['js/app.js'] + '.gz')).read_bytes()) == b'var x = 1;\n' * 100
+    assert assets.load(str(out))['files'] == files
+
+
+def test_stylesheets_point_at_fingerprinted_files(built):
+    out, manifest = built
+    css = (out / manifest['files']['css/custom.css']).read_text()
+    assert "url('../{}')".format(manifest['files']['img/bg.png']) in css
+    assert "url(../{}?v=1#x)".format(manifest['files']['fonts/f.woff']) in css
+
+
+def test_without_a_build_links_go_to_static(client):
+    body = client.get('/add').get_data(as_text=True)
+    assert '/static/css/custom.css' in body
+    assert client.get('/assets/css/custom.css').status_code == 404
+
+
+def test_assets_are_immutable_and_gzipped(client, built, monkeypatch):
+    out, manifest = built
+    monkeypatch.setattr(assets, 'manifest', dict(manifest, gzip=set(manifest['gzip'])))
+    monkeypatch.setattr(assets, 'served', set(manifest['files'].values()))
+    monkeypatch.setattr(assets, 'dist_folder', lambda app: str(out))
+    script = manifest['files']['js/app.js']
+
+    body = client.get('/add').get_data(as_text=True)
+    assert '/assets/' + manifest['files']['css/custom.css'] in body
+
+    response = client.get('/assets/' + script, headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['Cache-Control'] == 'public, max-age=31536000, immutable'
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert response.mimetype.endswith('/javascript')
+    assert gzip.decompress(response.get_data()) == b'var x = 1;\n' * 100
+
+    plain = client.get('/assets/' + script)
+    assert 'Content-Encoding' not in plain.headers
+    assert plain.get_data() == b'var x = 1;\n' * 100
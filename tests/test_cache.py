@@ -0,0 +1,57 @@
+import json
+
+from smash import cache
+from smash.querycount import count_queries
+
+
+def test_anonymous_pages_are_cached(client, add_quotes):
+    add_quotes(3)
+    first = client.get('/latest')
+    with count_queries() as statements:
+        second = client.get('/latest')
+    # Only the generation is read
+    assert len(statements) == 1
+    assert second.get_data() == first.get_data()
+    assert second.headers['ETag'] == first.headers['ETag']
+    assert second.headers['Cache-Control'] == 'no-cache'
+
+
+def test_matching_etag_gets_304(client, add_quotes):
+    add_quotes(3)
+    etag = client.get('/latest').headers['ETag']
+    response = client.get('/latest', headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.get_data() == b''
+
+
+def test_a_write_bumps_the_generation(client, add_quotes):
+    id, = add_quotes(1)
+    before = cache.generation()
+    etag = client.get('/quip/{}'.format(id)).headers['ETag']
+
+    client.post('/upvote', data=json.dumps({'postid': id}))
+    assert cache.generation() == before + 1
+
+    response = client.get('/quip/{}'.format(id), headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+
+
+def test_moderators_bypass_the_cache(moderator, add_quotes):
+    add_quotes(3)
+    moderator.get('/latest')
+    with count_queries() as statements:
+        response = moderator.get('/latest')
+    assert len(statements) > 1
+    assert 'ETag' not in response.headers
+
+
+def test_page_cache_keeps_the_newest_pages():
+    pages = cache.PageCache(size=2)
+    for key in ('a', 'b', 'c'):
+        pages.put(key, {'generation': 1, 'expires': float('inf')})
+    assert pages.get('a', 1) is None
+    assert pages.get('b', 1) is not None
+    # An older generation is dropped on read
+    assert pages.get('c', 2) is None
+    assert pages.get('c', 1) is None
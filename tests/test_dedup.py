@@ -0,0 +1,107 @@
+import io
+import json
+
+from smash import db, dedup, importer, moderation
+
+LOG = ("<alice> did anyone see the build at 12:31 break again because somebody "
+       "pushed straight to master without running the tests first")
+
+
+def submit(client, text):
+    """ Posts a quote to /slack, returns whether it was taken """
+    response = client.post('/slack', data={'text': text})
+    return json.loads(response.get_data(as_text=True))['status'] == 'success'
+
+
+def pending_ids():
+    return [id for id, in db.session.execute(
+        "SELECT id FROM quotes WHERE approved = 0 ORDER BY id")]
+
+
+def test_exact_ignores_only_case_and_spacing():
+    sketch = dedup.Sketch("Room 101 at 5pm")
+    assert dedup.Sketch("  room 101\nAT 5pm ").exact == sketch.exact
+    assert dedup.Sketch("Room 7 at 9pm").exact != sketch.exact
+    assert dedup.Sketch("Room 101 at 5pm!").exact != sketch.exact
+    assert dedup.Sketch("123").exact != dedup.Sketch("456").exact
+    assert dedup.Sketch("!!!").exact != dedup.Sketch("???").exact
+
+
+def test_shingles_ignore_numbers_and_punctuation():
+    sketch = dedup.Sketch(LOG)
+    assert sketch.similarity(dedup.Sketch(LOG.replace('12:31', '14:02').upper()).signature) == 1.0
+    assert sketch.similarity(dedup.Sketch(LOG.replace('somebody', 'bob')).signature) > 0.6
+    assert sketch.similarity(dedup.Sketch("cats and dogs asleep in the sun").signature) < 0.2
+
+
+def test_densify_fills_every_bin():
+    signature = [dedup.EMPTY] * dedup.BINS
+    signature[3] = 7
+    signature[40] = 9
+    filled = dedup.densify(signature)
+    assert filled[:4] == [7, 7, 7, 7]
+    assert filled[4:41] == [9] * 37
+    assert filled[41:] == [7] * (dedup.BINS - 41)
+
+
+def test_submissions_are_flagged(client):
+    submit(client, LOG)
+    submit(client, LOG.replace('12:31', '14:02'))
+    submit(client, "something else entirely, about lunch")
+    first, second, third = pending_ids()
+    found = dedup.duplicates([first, second, third])
+    assert found == {second: (first, 1.0, False)}
+
+
+def test_queue_shows_the_match(client, moderator):
+    submit(client, LOG)
+    submit(client, LOG.replace('12:31', '14:02'))
+    first, _ = pending_ids()
+    body = moderator.get('/queue').get_data(as_text=True)
+    assert 'Possible duplicate of\n  #{}'.format(first) in body
+    assert '(100% similar, also in the queue)' in body
+
+
+def test_exact_repeats_rejected_when_asked(client, monkeypatch):
+    monkeypatch.setattr(dedup, 'REJECT_EXACT', True)
+    assert submit(client, LOG)
+    assert not submit(client, LOG.upper())
+    assert submit(client, LOG.replace('12:31', '14:02'))
+    assert len(pending_ids()) == 2
+
+
+def test_delete_removes_index_rows(client):
+    for text in (LOG, LOG + " again", "a different quote"):
+        submit(client, text)
+    ids = pending_ids()
+    moderation.delete(ids[:2])
+    assert db.session.execute('SELECT count(*) FROM "dedupSignatures"').scalar() == 1
+    assert db.session.execute(
+        'SELECT count(*) FROM "dedupBuckets" WHERE quoteid NOT IN '
+        '(SELECT quoteid FROM "dedupSignatures")'
+    ).scalar() == 0
+
+
+def test_import_indexes_after_loading(client):
+    records = [{'content': LOG.replace('12:31', str(i)), 'time': '12:00:00 01/01/2021'}
+               for i in range(30)]
+    stream = io.StringIO('\n'.join(json.dumps(record) for record in records))
+    assert importer.run(stream, batch_size=7) == 30
+    assert db.session.execute('SELECT count(*) FROM "dedupSignatures"').scalar() == 30
+
+    submit(client, LOG)
+    new, = pending_ids()
+    assert dedup.duplicates([new])[new][1] == 1.0
+
+
+def test_index_missing_fills_gaps(client):
+    submit(client, LOG)
+    db.session.execute('DELETE FROM "dedupSignatures"')
+    db.session.commit()
+    connection = db.engine.raw_connection()
+    try:
+        assert dedup.index_missing(connection, batch=1) == 1
+        assert dedup.index_missing(connection) == 0
+    finally:
+        connection.close()
+    assert dedup.find(dedup.Sketch(LOG)).exact
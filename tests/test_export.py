@@ -0,0 +1,66 @@
+import csv
+import gzip
+import io
+import json
+
+from smash import export
+
+
+def records(response):
+    return json.loads(response.get_data(as_text=True))
+
+
+def test_json_matches_one_dump(client, add_quotes):
+    add_quotes(3, tags=['a', 'b'])
+    response = client.get('/export')
+    assert response.mimetype == 'application/json'
+    body = records(response)
+    assert [record['content'] for record in body] == [
+        "<nick> quote number 2", "<nick> quote number 1", "<nick> quote number 0"]
+    assert sorted(body[0]['tags']) == ['a', 'b']
+    assert response.get_data(as_text=True) == json.dumps(body)
+
+
+def test_empty_json(client, add_quotes):
+    add_quotes(2, approved=False)
+    assert client.get('/export').get_data(as_text=True) == '[]'
+
+
+def test_ndjson(client, add_quotes):
+    add_quotes(3)
+    response = client.get('/export?format=ndjson')
+    lines = response.get_data(as_text=True).splitlines()
+    assert response.mimetype == 'application/x-ndjson'
+    assert [json.loads(line)['content'] for line in lines] == [
+        "<nick> quote number 2", "<nick> quote number 1", "<nick> quote number 0"]
+
+
+def test_csv(client, add_quotes):
+    add_quotes(2, tags=['a'], content="<nick> quote, with \"quotes\"\n{}")
+    response = client.get('/export?format=csv')
+    rows = list(csv.reader(io.StringIO(response.get_data(as_text=True))))
+    assert rows[0] == export.FIELDS
+    assert rows[1][0] == "<nick> quote, with \"quotes\"\n1"
+    assert rows[1][4] == 'a'
+    assert len(rows) == 3
+
+
+def test_unknown_format(client):
+    assert client.get('/export?format=xml').status_code == 400
+
+
+def test_gzip_round_trips(client, add_quotes):
+    add_quotes(3, tags=['a'])
+    plain = client.get('/export?format=ndjson').get_data()
+    response = client.get('/export?format=ndjson', headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert gzip.decompress(response.get_data()) == plain
+
+
+def test_chunks_cover_every_quote_once(app, add_quotes):
+    ids = add_quotes(7, tags=['a'])
+    chunks = list(export.chunks(size=3))
+    assert [len(chunk) for chunk in chunks] == [3, 3, 1]
+    contents = [record['content'] for chunk in chunks for record in chunk]
+    assert contents == ["<nick> quote number {}".format(i) for i in reversed(range(len(ids)))]
+    assert all(record['tags'] == ['a'] for chunk in chunks for record in chunk)
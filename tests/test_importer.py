@@ -0,0 +1,71 @@
+import io
+import json
+
+import pytest
+
+from smash import counters, importer, search
+from smash.models_sqlalchemy import Quote
+
+
+def contents():
+    return [quote.content for quote in Quote.query.order_by(Quote.id)]
+
+
+def test_ndjson_in_batches(app):
+    lines = [json.dumps({'content': "<nick> line {}".format(i), 'rating': i,
+                         'tags': ['bulk'], 'time': '12:00:00 01/01/2021'})
+             for i in range(7)]
+    batches = []
+    imported = importer.run(io.StringIO('\n'.join(lines) + '\n'), batch_size=3,
+                            progress=lambda done, elapsed: batches.append(done))
+    assert imported == 7
+    assert batches == [3, 6, 7]
+    assert contents() == ["<nick> line {}".format(i) for i in range(7)]
+    assert all(quote.approved and [tag.name for tag in quote.tags] == ['bulk']
+               for quote in Quote.query)
+    assert counters.get(counters.APPROVED) == 7
+    assert search.search('line', 1).total == 7
+
+
+def test_export_round_trips(client, add_quotes):
+    add_quotes(3, tags=['a', 'b'])
+    exported = client.get('/export?order=asc').get_data(as_text=True)
+
+    assert importer.run(io.StringIO(exported)) == 3
+    assert contents()[3:] == contents()[:3]
+    copied = Quote.query.order_by(Quote.id.desc()).first()
+    assert sorted(tag.name for tag in copied.tags) == ['a', 'b']
+
+
+RECORDS = [
+    {'content': '<a> [x], "y" and ] closing', 'rating': 1234567, 'time': '12:00:00 01/01/2021'},
+    {'content': 'back\\slash \\"quoted\\", é', 'rating': -89, 'time': '12:00:00 01/01/2021'},
+    {'content': '<c> ,,, ]]] {{{', 'rating': 0, 'tags': ['x'], 'time': '12:00:00 01/01/2021'},
+]
+
+
+@pytest.mark.parametrize('size', [1, 2, 3, 7])
+def test_json_array_in_tiny_chunks(monkeypatch, size):
+    monkeypatch.setattr(importer, 'READ_SIZE', size)
+    document = json.dumps(RECORDS + [12345, 'tail]'])
+    assert list(importer.json_array(io.StringIO(document))) == RECORDS + [12345, 'tail]']
+
+
+def test_json_array_truncated(monkeypatch):
+    monkeypatch.setattr(importer, 'READ_SIZE', 4)
+    with pytest.raises(ValueError):
+        list(importer.json_array(io.StringIO(json.dumps(RECORDS)[:-20])))
+
+
+def test_resume_from_checkpoint(app, tmp_path, monkeypatch):
+    monkeypatch.setattr(importer, 'READ_SIZE', 5)
+    checkpoint = str(tmp_path / 'import.json')
+    records = [{'content': "<nick> line {}".format(i), 'time': '12:00:00 01/01/2021'}
+               for i in range(7)]
+    document = json.dumps(records)
+
+    # The first run stopped after committing two batches
+    assert importer.run(io.StringIO(json.dumps(records[:4])), checkpoint, batch_size=2) == 4
+    assert importer.run(io.StringIO(document), checkpoint, batch_size=2) == 3
+    assert contents() == [record['content'] for record in records]
+    assert counters.get(counters.APPROVED) == 7
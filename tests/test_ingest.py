@@ -0,0 +1,90 @@
+import json
+
+import pytest
+
+from smash import counters, db, dedup, ingest, metrics
+from smash.models_sqlalchemy import Quote, Tag
+
+TIME = '12:00:00 01/01/2021'
+
+
+def tags_of(quote_id):
+    return sorted(tag.name for tag in Quote.query.get(quote_id).tags)
+
+
+@pytest.fixture
+def queue(app, monkeypatch):
+    """ An IngestQueue with no writer thread; flush() is called directly """
+    monkeypatch.setattr(ingest, 'flush_seconds',
+                        metrics.Histogram('flush', 'Flush time', metrics.SECONDS, label='queue'),
+                        raising=False)
+    queue = ingest.IngestQueue(3600, 3)
+    queue.start = lambda: None
+    queue.app = app
+    return queue
+
+
+def test_write_resolves_tags_once(app, add_quotes):
+    add_quotes(1, tags=['old'])
+    submissions = [ingest.Submission('<a> first', '127.0.0.1', TIME, ['old', ' new ', '', 'new']),
+                   ingest.Submission('<b> second', '127.0.0.1', TIME, ['new'])]
+    assert ingest.write(submissions) == 2
+
+    first, second = [id for id, in db.session.query(Quote.id).filter_by(approved=False)]
+    assert tags_of(first) == ['new', 'old']
+    assert tags_of(second) == ['new']
+    assert Tag.query.count() == 2
+    assert counters.get(counters.PENDING) == 2
+
+
+def test_repeats_within_a_batch_are_caught(app, monkeypatch):
+    monkeypatch.setattr(dedup, 'REJECT_EXACT', True)
+    submissions = [ingest.Submission('<a> the same words here', '127.0.0.1', TIME),
+                   ingest.Submission('<A>  the same words HERE', '127.0.0.1', TIME)]
+    assert ingest.write(submissions) == 1
+    assert counters.get(counters.PENDING) == 1
+
+
+def test_queue_commits_and_indexes_on_flush(queue):
+    queue.add(ingest.Submission('<a> waiting for the writer', '127.0.0.1', TIME, ['q']))
+    assert len(queue) == 1
+    assert Quote.query.count() == 0
+
+    queue.flush()
+    assert len(queue) == 0
+    quote, = Quote.query.all()
+    assert tags_of(quote.id) == ['q']
+    assert counters.get(counters.PENDING) == 1
+    assert dedup.find(dedup.Sketch('<a> waiting for the writer')).exact
+    assert queue.flush() is None
+
+
+def test_full_queue_writes_in_the_request(queue):
+    for i in range(3):
+        queue.add(ingest.Submission('<a> quote {}'.format('x' * i), '127.0.0.1', TIME))
+    assert len(queue) == 0
+    assert Quote.query.count() == 3
+
+
+def test_failed_batch_is_retried_one_by_one(queue, monkeypatch):
+    write = ingest.write
+
+    def fussy(batch):
+        if len(batch) > 1 or batch[0].content == 'bad':
+            raise ValueError(batch[0].content)
+        return write(batch)
+
+    monkeypatch.setattr(ingest, 'write', fussy)
+    for content in ('good', 'bad'):
+        queue.add(ingest.Submission(content, '127.0.0.1', TIME))
+    queue.flush()
+    assert [quote.content for quote in Quote.query] == ['good']
+
+
+def test_add_queues_when_batching(client, queue, monkeypatch):
+    monkeypatch.setattr(ingest, 'queue', queue)
+    response = client.post('/slack', data={'text': '<a> from slack'})
+    assert json.loads(response.get_data(as_text=True)) == {'status': 'success'}
+    assert len(queue) == 1
+    queue.flush()
+    assert Quote.query.one().content == '<a> from slack'
@@ -0,0 +1,12 @@
+import logging
+
+from smash import create_app
+
+
+def test_apps_share_one_handler(monkeypatch):
+    root = logging.getLogger()
+    monkeypatch.setattr(root, 'handlers', [])
+    monkeypatch.setattr(root, 'level', root.level)
+    create_app()
+    create_app()
+    assert len(root.handlers) == 1
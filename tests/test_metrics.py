@@ -0,0 +1,65 @@
+from smash import metrics
+
+
+def series(body, line):
+    """ The value of one exposed series, 0 when it isn't there yet """
+    for exposed in body.splitlines():
+        if exposed.startswith(line + ' '):
+            return float(exposed.rsplit(' ', 1)[1])
+    return 0
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = metrics.Histogram('h', 'Help', (1, 5))
+    for value in (0.5, 3, 3, 9):
+        histogram.observe('r', value)
+    assert histogram.expose() == [
+        '# HELP h Help',
+        '# TYPE h histogram',
+        'h_bucket{route="r",le="1"} 1',
+        'h_bucket{route="r",le="5"} 3',
+        'h_bucket{route="r",le="+Inf"} 4',
+        'h_sum{route="r"} 15.5',
+        'h_count{route="r"} 4',
+    ]
+
+
+def test_metrics_need_a_moderator(client):
+    assert client.get('/metrics').status_code == 403
+
+
+def test_requests_are_counted(client, moderator, add_quotes):
+    add_quotes(3)
+    count = 'quips_request_seconds_count{route="quips.latest"}'
+    ok = 'quips_responses_total{route="quips.latest",status="200"}'
+    before = moderator.get('/metrics').get_data(as_text=True)
+    client.get('/latest')
+    client.get('/latest')
+
+    response = moderator.get('/metrics')
+    assert response.mimetype == 'text/plain'
+    body = response.get_data(as_text=True)
+    assert series(body, count) == series(before, count) + 2
+    assert series(body, ok) == series(before, ok) + 2
+    assert '# TYPE quips_request_queries histogram' in body
+    assert '# TYPE quips_ratelimit_refused gauge' in body
+
+
+def test_server_timing_header(client, add_quotes, monkeypatch):
+    add_quotes(3)
+    timing = client.get('/latest').headers['Server-Timing']
+    assert timing.startswith('db;dur=')
+    assert 'render;dur=' in timing
+    assert 'app;dur=' in timing
+
+    config = dict(metrics.conf.config, SERVER_TIMING=False)
+    monkeypatch.setattr(metrics.conf, 'config', config)
+    assert 'Server-Timing' not in client.get('/latest').headers
+
+
+def test_gauges_read_when_scraped(moderator, monkeypatch):
+    value = [1]
+    monkeypatch.setattr(metrics, 'registry', list(metrics.registry))
+    metrics.gauge('quips_test_value', 'A test value', lambda: value[0])
+    value[0] = 7
+    assert 'quips_test_value 7' in moderator.get('/metrics').get_data(as_text=True)
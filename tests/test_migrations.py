@@ -0,0 +1,123 @@
+import sqlite3
+
+import pytest
+
+from smash import create_app, db, migrations
+
+# The schema and data of a database from before the first migration
+BASELINE = """
+CREATE TABLE quotes (
+    id INTEGER NOT NULL PRIMARY KEY,
+    rating INTEGER,
+    content VARCHAR NOT NULL,
+    approved BOOLEAN,
+    author_ip VARCHAR NOT NULL,
+    time VARCHAR NOT NULL
+);
+CREATE TABLE tags (
+    id INTEGER NOT NULL PRIMARY KEY,
+    name VARCHAR NOT NULL UNIQUE
+);
+CREATE TABLE "tagsToQuotes" (
+    tagid INTEGER REFERENCES tags (id),
+    quoteid INTEGER REFERENCES quotes (id)
+);
+INSERT INTO quotes VALUES (1, 5, '<a> first quote', 1, '127.0.0.1', '12:00:00 01/02/2020');
+INSERT INTO quotes VALUES (2, -1, '<b> second quote', 1, '127.0.0.1', '13:00:00 03/04/2020');
+INSERT INTO quotes VALUES (3, 0, '<c> waiting quote', 0, '127.0.0.1', '14:00:00 05/06/2020');
+INSERT INTO tags VALUES (1, 'old');
+INSERT INTO "tagsToQuotes" VALUES (1, 1);
+INSERT INTO "tagsToQuotes" VALUES (1, 1);
+INSERT INTO "tagsToQuotes" VALUES (1, 2);
+"""
+
+
+@pytest.fixture
+def baseline(app, tmp_path):
+    """ An app on a database with the baseline schema """
+    path = str(tmp_path / 'baseline.db')
+    connection = sqlite3.connect(path)
+    connection.executescript(BASELINE)
+    connection.close()
+
+    baseline = create_app()
+    baseline.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + path
+    # The session is per thread and stays bound to the app it was opened for
+    db.session.remove()
+    with baseline.app_context():
+        yield baseline
+        db.session.remove()
+        db.get_engine(baseline).dispose()
+
+
+def scalar(sql):
+    return db.session.execute(sql).scalar()
+
+
+def test_migrate_upgrades_a_baseline_database(baseline):
+    result = baseline.test_cli_runner().invoke(args=['migrate'])
+    assert result.exit_code == 0, result.output
+    assert "Schema upgraded from version 0 to {}".format(len(migrations.MIGRATIONS)) in result.output
+    assert "SLOW" not in result.output
+
+    assert scalar("PRAGMA user_version") == len(migrations.MIGRATIONS)
+    assert scalar("SELECT value FROM counters WHERE name = 'approved'") == 2
+    assert scalar("SELECT value FROM counters WHERE name = 'pending'") == 1
+    assert scalar('SELECT count(*) FROM "tagsToQuotes"') == 2
+    assert scalar("SELECT count(*) FROM sqlite_master WHERE name = 'ix_quotes_approved_id'") == 1
+    assert scalar("SELECT count(*) FROM quotes WHERE created IS NULL") == 0
+    assert scalar('SELECT count(*) FROM "dedupSignatures"') == 3
+    assert scalar("SELECT count(*) FROM quotes_fts WHERE quotes_fts MATCH 'quote'") == 2
+
+
+def test_migrate_twice(baseline):
+    runner = baseline.test_cli_runner()
+    runner.invoke(args=['migrate'])
+    result = runner.invoke(args=['migrate'])
+    assert "Schema is up to date (version {})".format(len(migrations.MIGRATIONS)) in result.output
+
+
+def test_upgraded_database_serves_pages(baseline):
+    baseline.test_cli_runner().invoke(args=['migrate'])
+    body = baseline.test_client().get('/tag/old').get_data(as_text=True)
+    assert 'first quote' in body
+    assert 'second quote' in body
+    assert 'waiting quote' not in body
+
+
+def test_explain_passes_on_a_new_database(app):
+    report = migrations.explain()
+    assert [name for name, _, ok in report if not ok] == []
+    assert len(report) == len(migrations.HOT_QUERIES)
+
+
+def test_explain_flags_a_missing_index(app):
+    db.session.execute("DROP INDEX ix_quotes_approved_id")
+    db.session.commit()
+    flagged = [name for name, _, ok in migrations.explain() if not ok]
+    assert flagged == ['queue seek', 'tag links']
+
+
+def test_follows():
+    expected = [("tagsToQuotes", "ux_tagsToQuotes_tagid_quoteid (tagid=?)"),
+                ("quotes", "PRIMARY KEY")]
+    good = ["SEARCH tagsToQuotes USING COVERING INDEX ux_tagsToQuotes_tagid_quoteid (tagid=?)",
+            "SEARCH quotes USING INTEGER PRIMARY KEY (rowid=?)"]
+    # Walks every approved quote and probes each for the tag
+    walk = ["SEARCH quotes USING INDEX ix_quotes_approved_id (approved=?)",
+            "SEARCH tagsToQuotes USING COVERING INDEX ux_tagsToQuotes_tagid_quoteid "
+            "(tagid=? AND quoteid=?)"]
+    assert migrations.follows(good, expected)
+    assert not migrations.follows(walk, expected)
+    assert not migrations.follows(good[::-1], expected)
+
+
+def test_search_index_built_at_startup_is_refilled(app, add_quotes):
+    add_quotes(3)
+    # The index as app startup used to build it, before it was a migration
+    db.session.execute("PRAGMA user_version = {:d}".format(len(migrations.MIGRATIONS) - 1))
+    db.session.execute("INSERT INTO quotes_fts (rowid, content) VALUES (999, 'stale quote')")
+    db.session.commit()
+
+    assert migrations.upgrade() == (len(migrations.MIGRATIONS) - 1, len(migrations.MIGRATIONS))
+    assert scalar("SELECT count(*) FROM quotes_fts WHERE quotes_fts MATCH 'quote'") == 3
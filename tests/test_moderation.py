@@ -0,0 +1,82 @@
+import threading
+
+from smash import counters, db, moderation
+from smash.models_sqlalchemy import Quote, Tag
+
+
+def totals():
+    return counters.get(counters.APPROVED), counters.get(counters.PENDING)
+
+
+def test_bulk_approve(moderator, add_quotes):
+    ids = add_quotes(3, tags=['a'], approved=False)
+    response = moderator.post('/moderate', data={'quoteid': ids[:2], 'submit': 'Approve'})
+    assert '2 quips approved.' in response.get_data(as_text=True)
+    assert [quote.id for quote in Quote.query.filter_by(approved=True)] == ids[:2]
+    assert totals() == (2, 1)
+
+
+def test_bulk_delete_removes_dangling_tags(moderator, add_quotes):
+    kept = add_quotes(1, tags=['shared'])
+    gone = add_quotes(2, tags=['shared', 'only'], approved=False)
+    response = moderator.post('/moderate', data={'quoteid': kept + gone, 'submit': 'Delete'})
+    assert '3 quips deleted.' in response.get_data(as_text=True)
+    assert Quote.query.count() == 0
+    assert Tag.query.count() == 0
+    assert totals() == (0, 0)
+
+
+def test_delete_keeps_tags_still_in_use(app, add_quotes):
+    kept = add_quotes(1, tags=['shared'])
+    gone = add_quotes(1, tags=['shared', 'only'])
+    assert moderation.delete(gone) == 1
+    assert [tag.name for tag in Tag.query] == ['shared']
+    assert [quote.id for quote in Quote.query] == kept
+    assert totals() == (1, 0)
+
+
+def test_unknown_and_approved_ids(moderator, add_quotes):
+    approved = add_quotes(1)
+    response = moderator.post('/moderate', data={'quoteid': approved + [999], 'submit': 'Approve'})
+    assert 'No such quip.' in response.get_data(as_text=True)
+    response = moderator.post('/moderate', data={'quoteid': [999], 'submit': 'Delete'})
+    assert 'No such quip.' in response.get_data(as_text=True)
+    assert totals() == (1, 0)
+
+
+def test_needs_a_moderator(client, add_quotes):
+    ids = add_quotes(1, approved=False)
+    response = client.post('/moderate', data={'quoteid': ids, 'submit': 'Approve'})
+    assert 'not authorized' in response.get_data(as_text=True)
+    assert db.session.query(Quote.approved).scalar() is False
+
+
+def test_queue_pages(moderator, add_quotes):
+    ids = add_quotes(60, approved=False)
+    first = moderator.get('/queue').get_data(as_text=True)
+    assert first.count('name="quoteid"') == 50
+    assert 'href="/queue/2?after={}"'.format(ids[49]) in first
+    second = moderator.get('/queue/2?after={}'.format(ids[49])).get_data(as_text=True)
+    assert second.count('name="quoteid"') == 10
+
+
+def test_racing_moderators_count_once(app, add_quotes):
+    """ Two workers approving, then deleting, the same quotes at once """
+    ids = add_quotes(20, approved=False)
+    add_quotes(5)
+    barrier = threading.Barrier(2)
+
+    def worker(action):
+        with app.app_context():
+            barrier.wait()
+            action(ids)
+            db.session.remove()
+
+    for action in (moderation.approve, moderation.approve, moderation.delete, moderation.delete):
+        threads = [threading.Thread(target=worker, args=(action,)) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert totals() == (Quote.query.filter_by(approved=True).count(),
+                            Quote.query.filter_by(approved=False).count())
@@ -0,0 +1,57 @@
+from smash import db, ranking, votes
+from smash.models_sqlalchemy import HOT_DECAY, Quote, hot_score
+
+
+def hot(id):
+    return db.session.query(Quote.hot).filter_by(id=id).scalar()
+
+
+def dirty():
+    return [id for id, in db.session.execute('SELECT quoteid FROM "hotDirty" ORDER BY quoteid')]
+
+
+def test_hot_score():
+    assert hot_score(0, 1000) == 1000
+    assert hot_score(1, 1000) == 1000
+    assert hot_score(10, 1000) == 1000 + HOT_DECAY
+    assert hot_score(-100, 1000) == 1000 - 2 * HOT_DECAY
+    assert hot_score(None, None) == 0
+
+
+def test_new_quotes_are_scored(app, add_quotes):
+    id, = add_quotes(1)
+    quote = Quote.query.get(id)
+    assert hot(id) == quote.created
+
+
+def test_votes_queue_a_rescore(app, add_quotes):
+    first, second = add_quotes(2)
+    created = hot(first)
+    for _ in range(10):
+        votes.vote(first, 1)
+    votes.vote(second, -1)
+    assert dirty() == [first, second]
+    assert hot(first) == created
+
+    assert ranking.refresh(batch=1) == 2
+    assert dirty() == []
+    assert hot(first) == created + HOT_DECAY
+    assert ranking.refresh() == 0
+
+
+def test_hot_page_follows_the_scores(client, add_quotes):
+    old, new = add_quotes(2)
+    for _ in range(10):
+        votes.vote(old, 1)
+    ranking.refresh()
+    body = client.get('/hot').get_data(as_text=True)
+    assert body.index('/quip/{}"'.format(old)) < body.index('/quip/{}"'.format(new))
+
+
+def test_rank_hot_all(app, add_quotes):
+    id, = add_quotes(1)
+    db.session.execute("UPDATE quotes SET hot = 0")
+    db.session.commit()
+    result = app.test_cli_runner().invoke(args=['rank-hot', '--all'])
+    assert "Rescored 1 quotes." in result.output
+    assert hot(id) == Quote.query.get(id).created
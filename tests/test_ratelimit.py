@@ -0,0 +1,101 @@
+from urllib.parse import urlparse
+
+import pytest
+from limits import parse
+from limits.strategies import FixedWindowRateLimiter
+
+from smash import ratelimit
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(ratelimit.time, 'time', lambda: now[0])
+    return now
+
+
+def storage(tmp_path, query='', name='limits'):
+    shared = ratelimit.SharedMemoryStorage('shm://{}{}'.format(tmp_path / name, query))
+    # No collector threads in tests; collect() is called directly
+    shared.start_gc = lambda: None
+    return shared
+
+
+def test_counts_within_a_window(tmp_path, clock):
+    shared = storage(tmp_path)
+    assert shared.incr('a', 60) == 1
+    assert shared.incr('a', 60) == 2
+    assert shared.incr('b', 60) == 1
+    assert shared.get('a') == 2
+    assert shared.get_expiry('a') == 1060
+    shared.clear('a')
+    assert shared.get('a') == 0
+    assert shared.get('b') == 1
+
+
+def test_windows_expire(tmp_path, clock):
+    shared = storage(tmp_path)
+    shared.incr('a', 60)
+    clock[0] += 61
+    assert shared.get('a') == 0
+    assert shared.incr('a', 60) == 1
+
+
+def test_workers_share_the_table(tmp_path, clock):
+    first = storage(tmp_path)
+    second = storage(tmp_path)
+    first.incr('a', 60)
+    assert second.incr('a', 60) == 2
+
+
+def test_slots_from_the_uri(tmp_path):
+    assert storage(tmp_path, '?slots=1024').slots == 1024
+    assert storage(tmp_path, name='default').slots == ratelimit.SLOTS
+    with pytest.raises(ValueError):
+        storage(tmp_path, '?slots=4', name='small')
+
+
+def test_full_window_refuses_instead_of_evicting(tmp_path, clock, monkeypatch):
+    monkeypatch.setattr(ratelimit, 'refused', 0)
+    # Every key shares the one window of PROBES slots
+    shared = storage(tmp_path, '?slots={}'.format(ratelimit.PROBES))
+    for i in range(ratelimit.PROBES):
+        assert shared.incr('key{}'.format(i), 60) == 1
+    assert shared.incr('extra', 60) == ratelimit.REFUSED
+    assert ratelimit.refused == 1
+    assert all(shared.get('key{}'.format(i)) == 1 for i in range(ratelimit.PROBES))
+
+    # Expired windows make room again
+    clock[0] += 61
+    assert shared.incr('extra', 60) == 1
+
+
+def test_refused_hits_are_limited(tmp_path, clock):
+    shared = storage(tmp_path, '?slots={}'.format(ratelimit.PROBES))
+    limiter = FixedWindowRateLimiter(shared)
+    limit = parse("100 per minute")
+    for i in range(ratelimit.PROBES):
+        assert limiter.hit(limit, 'key{}'.format(i))
+    assert not limiter.hit(limit, 'extra')
+
+
+def test_collect_wipes_expired(tmp_path, clock):
+    shared = storage(tmp_path, '?slots=64')
+    shared.incr('old', 10)
+    shared.incr('new', 100)
+    clock[0] += 50
+    shared.collect(batch=16)
+    stored = [ratelimit.SLOT.unpack_from(shared.table, slot * ratelimit.SLOT.size)[0]
+              for slot in range(shared.slots)]
+    assert sum(1 for key_hash in stored if key_hash) == 1
+    assert shared.get('new') == 1
+
+
+def test_default_table_per_database():
+    first = ratelimit.storage_url('shm://', 'sqlite:////srv/one/quips.db')
+    assert first == 'shm://' + ratelimit.default_path('sqlite:////srv/one/quips.db')
+    assert ratelimit.storage_url('shm://', 'sqlite:////srv/two/quips.db') != first
+    assert ratelimit.storage_url('shm://?slots=64', 'sqlite:////srv/one/quips.db') == first + '?slots=64'
+    assert ratelimit.storage_url('shm:///tmp/limits', 'sqlite:////srv/one/quips.db') == 'shm:///tmp/limits'
+    assert ratelimit.storage_url('memory://', 'sqlite:////srv/one/quips.db') == 'memory://'
+    assert urlparse(first).path == ratelimit.default_path('sqlite:////srv/one/quips.db')
@@ -0,0 +1,83 @@
+from smash import db, moderation, readmodel, votes
+from smash.models_sqlalchemy import Quote
+
+
+def other_worker():
+    """ A second worker's read model, loaded from the database as it is now """
+    model = readmodel.ReadModel()
+    model.refresh()
+    return model
+
+
+def matches_database(model):
+    fresh = other_worker()
+    return (model.ids == fresh.ids and model.ratings == fresh.ratings and
+            model.top == fresh.top and model.postings == fresh.postings)
+
+
+def tag_id(model, quote_id):
+    return next(tagid for tagid, posting in model.postings.items() if quote_id in posting)
+
+
+def test_load(app, add_quotes):
+    ids = add_quotes(3, tags=['a'])
+    add_quotes(2, approved=False)
+    model = other_worker()
+    assert list(model.ids) == ids
+    assert list(model.tagged([tag_id(model, ids[0])])) == ids
+
+
+def test_refresh_follows_approve_vote_and_delete(app, add_quotes):
+    approved = add_quotes(3, tags=['a'])
+    pending = add_quotes(2, tags=['a', 'b'], approved=False)
+    model = other_worker()
+    seq = model.seq
+
+    moderation.approve(pending)
+    votes.vote(approved[0], 1)
+    votes.vote(approved[0], 1)
+    moderation.delete([approved[1]])
+
+    model.refresh()
+    assert model.seq > seq
+    assert list(model.ids) == [approved[0], approved[2]] + pending
+    assert matches_database(model)
+
+
+def test_listings_see_changes_from_other_workers(client, add_quotes):
+    ids = add_quotes(12)
+    assert readmodel.latest(1).items[0].id == ids[-1]
+
+    # Written the way another worker would, straight to the database
+    Quote.query.filter_by(id=ids[-1]).update({Quote.approved: False})
+    Quote.query.filter_by(id=ids[0]).update({Quote.rating: 50})
+    readmodel.changed([ids[-1], ids[0]])
+    db.session.commit()
+
+    assert readmodel.latest(1).items[0].id == ids[-2]
+    assert readmodel.latest(1).total == 11
+    assert readmodel.top(1).items[0].id == ids[0]
+
+
+def test_many_changes_reload(app, add_quotes):
+    model = other_worker()
+    add_quotes(readmodel.RELOAD + 5)
+    model.refresh()
+    assert len(model.ids) == readmodel.RELOAD + 5
+    assert matches_database(model)
+
+
+def test_tagged_intersects(app, add_quotes):
+    both = add_quotes(2, tags=['x', 'y'])
+    add_quotes(2, tags=['x'])
+    add_quotes(2, tags=['y'])
+    model = other_worker()
+    x = tag_id(model, both[0])
+    y = next(tagid for tagid in model.postings if tagid != x and both[0] in model.postings[tagid])
+    assert list(model.tagged([x, y])) == both
+    assert list(model.tagged([x, 999])) == []
+
+
+def test_top_key_orders_by_rating_then_id():
+    keys = [readmodel.top_key(rating, id) for rating, id in [(0, 5), (1, 2), (1, 3), (-1, 9)]]
+    assert sorted(keys) == [keys[3], keys[0], keys[1], keys[2]]
@@ -0,0 +1,34 @@
+import pytest
+
+from smash import readmodel, sampling
+
+
+@pytest.mark.parametrize('span', [1, 2, 3, 7, 16, 17, 1000, 4097])
+def test_permutation_is_a_bijection(span):
+    shuffle = sampling.permutation(42, span)
+    assert sorted(shuffle(position) for position in range(span)) == list(range(span))
+
+
+def test_permutation_depends_on_the_seed():
+    first = [sampling.permutation(1, 1000)(position) for position in range(1000)]
+    again = [sampling.permutation(1, 1000)(position) for position in range(1000)]
+    other = [sampling.permutation(2, 1000)(position) for position in range(1000)]
+    assert first == again
+    assert first != other
+    assert first != sorted(first)
+
+
+def test_random_pages_visit_every_quote_once(app, add_quotes):
+    ids = add_quotes(25)
+    seen = []
+    for number in (1, 2, 3):
+        seen.extend(quote.id for quote in readmodel.sample(7, number).items)
+    assert sorted(seen) == sorted(ids)
+    assert readmodel.sample(7, 4).items == []
+
+
+def test_random_keeps_its_seed(client, add_quotes):
+    add_quotes(25)
+    response = client.get('/random/2')
+    assert response.status_code == 302
+    assert '/random/2?seed=' in response.headers['Location']
@@ -0,0 +1,42 @@
+import pytest
+
+from smash import search
+from smash.search import match_expression
+
+
+@pytest.mark.parametrize('query, expression', [
+    ('cats dogs', '"cats" "dogs"'),
+    ('"fell over"', '"fell over"'),
+    ('"unclosed phrase', '"unclosed phrase"'),
+    ('rebo*', '"rebo"*'),
+    ('say "hi" twice', '"say" "hi" "twice"'),
+    ('a"b', '"a""b"'),
+    ('NEAR(a b) OR c', '"NEAR(a" "b)" "OR" "c"'),
+    ('content:secret -x ^y', '"content:secret" "-x" "^y"'),
+    ('"" * **', ''),
+    ('   ', ''),
+])
+def test_match_expression(query, expression):
+    assert match_expression(query) == expression
+
+
+def test_operators_are_matched_as_words(app, add_quotes):
+    add_quotes(1, content="<bob> cats OR dogs {}")
+    add_quotes(1, content="<bob> only cats here {}")
+    # Unquoted, OR would find both quotes
+    assert search.search('cats OR dogs', 1).total == 1
+
+
+@pytest.mark.parametrize('query', ['"', 'a"b', 'NEAR(', '*', 'x:y', '(', '-', 'AND'])
+def test_syntax_characters_are_harmless(client, add_quotes, query):
+    add_quotes(3)
+    response = client.get('/search/' + query)
+    assert response.status_code == 200
+
+
+def test_phrase_and_prefix(app, add_quotes):
+    add_quotes(1, content="<bob> the build fell over {}")
+    add_quotes(1, content="<bob> over the build it fell {}")
+    assert search.search('"fell over"', 1).total == 1
+    assert search.search('buil*', 1).total == 2
+    assert search.search('buil', 1).total == 0
@@ -0,0 +1,42 @@
+import json
+
+from smash import moderation, suggest
+
+
+def test_most_used_first_ignoring_case():
+    index = suggest.PrefixIndex([('python', 2), ('Perl', 5), ('php', 5), ('ruby', 9)])
+    assert index.match('p') == ['Perl', 'php', 'python']
+    assert index.match('PY') == ['python']
+    assert index.match('p', limit=1) == ['Perl']
+    assert index.match('x') == []
+
+
+def test_only_matching_short_prefixes_are_memoised():
+    index = suggest.PrefixIndex([('perl', 1), ('python', 1)])
+    index.match('p')
+    index.match('py')
+    index.match('pyt')
+    index.match('zz')
+    assert sorted(index.memo) == [('p', suggest.LIMIT), ('py', suggest.LIMIT)]
+
+
+def test_endpoint(client, add_quotes):
+    add_quotes(2, tags=['linux'])
+    add_quotes(1, tags=['lisp'])
+    response = client.get('/tags/suggest?q=li')
+    assert json.loads(response.get_data(as_text=True)) == ['linux', 'lisp']
+    assert response.headers['Cache-Control'] == 'public, max-age=5'
+    assert json.loads(client.get('/tags/suggest').get_data(as_text=True)) == []
+
+
+def test_pending_tags_are_not_suggested(client, add_quotes):
+    add_quotes(1, tags=['spam'], approved=False)
+    assert suggest.suggest('sp') == []
+
+
+def test_index_follows_the_tag_cloud(app, add_quotes, monkeypatch):
+    monkeypatch.setattr(suggest, 'CHECK_INTERVAL', 0)
+    pending = add_quotes(1, tags=['fresh'], approved=False)
+    assert suggest.suggest('fr') == []
+    moderation.approve(pending)
+    assert suggest.suggest('fr') == ['fresh']
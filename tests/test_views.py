@@ -0,0 +1,96 @@
+import pytest
+
+from smash.querycount import assert_max_queries, count_queries
+
+LISTINGS = [
+    ('/latest', 4),
+    ('/browse', 4),
+    ('/top', 4),
+    ('/hot', 4),
+    ('/random?seed=1', 4),
+    ('/tag/shared', 5),
+    ('/search/quote', 4),
+]
+
+
+@pytest.mark.parametrize('url, limit', LISTINGS)
+def test_listing_statements(client, add_quotes, url, limit):
+    add_quotes(15, tags=['shared', 'other'])
+    with assert_max_queries(limit):
+        response = client.get(url)
+    assert response.status_code == 200
+    body = response.get_data(as_text=True)
+    assert body.count('quote number') == 10
+    assert 'other' in body
+
+
+@pytest.mark.parametrize('url', [url for url, _ in LISTINGS])
+def test_tags_load_in_one_batch(moderator, add_quotes, url):
+    """ A page of tagged quotes costs what a page of one quote does """
+    # Measured after a first request, which catches the read model up
+    add_quotes(1, tags=['shared', 'other'])
+    moderator.get(url)
+    with count_queries() as one:
+        moderator.get(url)
+    add_quotes(9, tags=['shared', 'other'])
+    moderator.get(url)
+    with count_queries() as ten:
+        moderator.get(url)
+    assert len(ten) == len(one)
+
+
+def test_queue_statements(moderator, add_quotes):
+    add_quotes(15, tags=['shared'], approved=False)
+    with assert_max_queries(4):
+        response = moderator.get('/queue')
+    assert response.status_code == 200
+    assert response.get_data(as_text=True).count('name="quoteid"') == 15
+
+
+def test_quote_page(client, add_quotes):
+    id, = add_quotes(1, tags=['shared'])
+    with assert_max_queries(3):
+        response = client.get('/quip/{}'.format(id))
+    assert 'quote number 0' in response.get_data(as_text=True)
+
+
+def test_quote_bodies_are_escaped_not_rewritten(client, add_quotes):
+    from smash.models_sqlalchemy import Quote
+
+    id, = add_quotes(1, content="<b>bold</b>\nsecond line {}")
+    body = client.get('/quip/{}'.format(id)).get_data(as_text=True)
+    assert '&lt;b&gt;bold&lt;/b&gt;</br>second line 0' in body
+    assert Quote.query.get(id).content == "<b>bold</b>\nsecond line 0"
+
+
+def test_tag_cloud_counts_approved_quotes(client, add_quotes):
+    add_quotes(1, tags=['rare'])
+    add_quotes(3, tags=['common'])
+    add_quotes(5, tags=['waiting'], approved=False)
+    with assert_max_queries(2):
+        response = client.get('/tags?sort=popular')
+    body = response.get_data(as_text=True)
+    assert body.index('>common<') < body.index('>rare<')
+    assert 'waiting' not in body
+    assert client.get('/tags?sort=size').status_code == 400
+
+
+def test_tag_pages(client, add_quotes):
+    add_quotes(25, tags=['shared'])
+    add_quotes(5, tags=['other'])
+    second = client.get('/tag/shared/2').get_data(as_text=True)
+    assert 'quote number 14</p>' in second
+    assert 'quote number 5</p>' in second
+    assert 'quote number 15</p>' not in second
+    assert 'quote number 4</p>' not in second
+
+
+def test_tags_combine_with_plus(client, add_quotes):
+    add_quotes(2, tags=['a', 'b'], content="<nick> both {}")
+    add_quotes(2, tags=['a'], content="<nick> only a {}")
+    add_quotes(1, tags=['c++'], content="<nick> plus plus {}")
+    body = client.get('/tag/a+b').get_data(as_text=True)
+    assert body.count('both') == 2
+    assert 'only a' not in body
+    assert 'plus plus 0' in client.get('/tag/c++').get_data(as_text=True)
+    assert 'No quotes with this tag.' in client.get('/tag/a+nope').get_data(as_text=True)
@@ -0,0 +1,60 @@
+import json
+
+from smash import db, votes
+from smash.models_sqlalchemy import Quote
+from smash.querycount import count_queries
+
+
+def rating(id):
+    return db.session.query(Quote.rating).filter_by(id=id).scalar()
+
+
+def test_votes_add_to_the_rating(client, add_quotes):
+    id, = add_quotes(1)
+    before = rating(id)
+    response = client.post('/upvote', data=json.dumps({'postid': id}))
+    assert json.loads(response.get_data(as_text=True)) == {'status': 'success'}
+    client.post('/upvote', data=json.dumps({'postid': id}))
+    client.post('/downvote', data=json.dumps({'postid': id}))
+    assert rating(id) == before + 1
+
+
+def test_unknown_quotes(client, add_quotes):
+    add_quotes(1)
+    for payload in ({'postid': 999}, {'postid': 'x'}, {}):
+        response = client.post('/upvote', data=json.dumps(payload))
+        assert json.loads(response.get_data(as_text=True)) == {'status': 'no post found'}
+
+
+def test_apply_increments_in_sql(app, add_quotes):
+    first, second, third = add_quotes(3)
+    with count_queries() as statements:
+        assert votes.apply({first: 2, second: -1, third: 0}) == 2
+    assert all('rating + ' in statement for statement in statements if 'UPDATE quotes' in statement)
+    assert [rating(id) for id in (first, second, third)] == [2, -1, 0]
+
+
+def test_buffer_flushes_sums_per_quote(app, add_quotes):
+    first, second = add_quotes(2)
+    buffer = votes.VoteBuffer(interval=3600, size=4)
+    buffer.add(first, 1)
+    buffer.add(first, 1)
+    buffer.add(second, -1)
+    # Nothing is written until the buffer fills or the interval passes
+    assert (rating(first), rating(second)) == (0, 0)
+
+    with count_queries() as statements:
+        buffer.add(first, -1)
+    assert (rating(first), rating(second)) == (1, -1)
+    assert len([statement for statement in statements if statement.startswith('UPDATE quotes')]) == 2
+    assert buffer.votes == 0 and not buffer.deltas
+
+
+def test_buffered_vote_checks_the_quote(app, add_quotes, monkeypatch):
+    id, = add_quotes(1)
+    buffer = votes.VoteBuffer(interval=3600, size=100)
+    monkeypatch.setattr(votes, 'buffer', buffer)
+    assert votes.vote(id, 1)
+    assert not votes.vote(999, 1)
+    buffer.flush()
+    assert rating(id) == 1
@@ -1,5 +1,6 @@
-from smash import app
+from smash import create_app
+
+app = create_app()
 
 if __name__ == "__main__":
     app.run()
-